@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""Peak memory per dashboard rerun, before and after copy-on-write ledger views.
+
+Each mode runs in a fresh process; the peak resident set size (VmHWM) is reset
+before every simulated rerun, so each figure is the extra memory that one rerun
+needed on top of the loaded ledger. Linux only.
+
+Usage:
+    python benchmark_memory.py [n_rows] [reruns]
+"""
+
+import gc
+import sys
+import multiprocessing as mp
+import numpy as np
+import pandas as pd
+
+
+def make_ledger(n_rows, seed=42):
+    """Build a synthetic ledger shaped like st.session_state.transactions"""
+    rng = np.random.default_rng(seed)
+    categories = np.array(["Income", "Groceries", "Dining", "Entertainment", "Transport", "Shopping", "Utilities", "Other"])
+    category = categories[rng.integers(0, len(categories), n_rows)]
+    amount = rng.uniform(5, 200, n_rows)
+    dates = pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 730, n_rows), unit="D")
+
+    return pd.DataFrame({
+        "date": dates.strftime("%Y-%m-%d"),
+        "category": category,
+        "amount": np.where(category == "Income", amount * 10, -amount),
+        "description": [f"Transaction {i+1}" for i in range(n_rows)],
+        "type": np.where(category == "Income", "income", "expense")
+    })
+
+
+def rerun_with_copies(transactions):
+    """One rerun of the hot read paths as they were, each one copying the ledger"""
+    # Expense predictor, clusters, custom insights and future expenses
+    for _ in range(4):
+        df = transactions.copy()
+        df['date'] = pd.to_datetime(df['date'])
+        df['month'] = df['date'].dt.month
+        df['day_of_week'] = df['date'].dt.dayofweek
+        df['amount_abs'] = df['amount'].abs()
+
+    # Budget optimizer
+    df = transactions.copy()
+    df[df['type'] == 'expense'].copy().groupby('category')['amount'].sum()
+
+    # Transaction filter
+    filtered = transactions.copy()
+    filtered['date'] = pd.to_datetime(filtered['date'])
+    filtered = filtered[filtered['date'] >= filtered['date'].max() - pd.Timedelta(days=30)]
+    display = filtered.copy()
+    display['date'] = display['date'].dt.strftime('%Y-%m-%d')
+
+    # Cash-flow tab
+    df = transactions.copy()
+    df['date'] = pd.to_datetime(df['date'])
+    df['month'] = df['date'].dt.strftime('%Y-%m')
+    df.groupby(['month', 'type'])['amount'].sum()
+
+
+def rerun_with_views(transactions):
+    """One rerun of the same read paths through the feature store and ledger views"""
+    import un
+
+    # Expense predictor, clusters, custom insights and future expenses
+    for _ in range(4):
+        un.get_transaction_features(transactions)
+
+    # Budget optimizer
+    df = un.get_ledger_view(transactions)
+    df[df['type'] == 'expense'].groupby('category')['amount'].sum()
+
+    # Transaction filter
+    features = un.get_transaction_features(transactions)
+    mask = features['date'] >= features['date'].max() - pd.Timedelta(days=30)
+    un.get_ledger_view(transactions)[mask]
+
+    # Cash-flow tab
+    df = un.get_transaction_features(transactions)
+    df['month'] = df['date'].dt.to_period('M')
+    df.groupby(['month', 'type'], observed=True)['amount'].sum()
+
+
+def read_status_mb(field):
+    """Read a memory field of this process from /proc/self/status, in megabytes"""
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def reset_peak_rss():
+    # Writing 5 to clear_refs resets VmHWM, the peak resident set size (Linux only)
+    with open("/proc/self/clear_refs", "w") as clear_refs:
+        clear_refs.write("5")
+
+
+def run_mode(mode, n_rows, reruns, results):
+    transactions = make_ledger(n_rows)
+
+    if mode == "views":
+        import un
+        un.st.session_state.transactions = transactions
+        un.st.session_state.ledger_version = 0
+
+    rerun = rerun_with_views if mode == "views" else rerun_with_copies
+
+    peaks = []
+    for _ in range(reruns):
+        gc.collect()
+        baseline = read_status_mb("VmRSS")
+        reset_peak_rss()
+        rerun(transactions)
+        peaks.append(read_status_mb("VmHWM") - baseline)
+
+    results[mode] = {"ledger_mb": transactions.memory_usage(deep=True).sum() / 2**20, "peaks_mb": peaks}
+
+
+def main():
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    reruns = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    manager = mp.Manager()
+    results = manager.dict()
+
+    for mode in ["copies", "views"]:
+        process = mp.Process(target=run_mode, args=(mode, n_rows, reruns, results))
+        process.start()
+        process.join()
+
+    print(f"Peak RSS per rerun above the loaded ledger, {n_rows:,} rows")
+    for mode in ["copies", "views"]:
+        result = results[mode]
+        peaks = ", ".join(f"{peak:.0f}" for peak in result["peaks_mb"])
+        print(f"  {mode:<7} ledger {result['ledger_mb']:.0f} MB, reruns: {peaks} MB")
+
+
+if __name__ == "__main__":
+    main()
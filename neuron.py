@@ -2,34 +2,35 @@
 # Add these imports at the top of the file
 from sklearn.ensemble import RandomForestRegressor, RandomForestClassifier
 from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
-from sklearn.decomposition import PCA
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.decomposition import PCA, IncrementalPCA
 import tensorflow as tf
 import pickle
 import joblib
 from PIL import Image
 from io import BytesIO
 import base64
-import nltk
 import re
 import warnings
+import time
+from joblib import Parallel, delayed
+from sklearn.metrics import silhouette_score
 warnings.filterwarnings('ignore')
 
 # Add these functions after the existing imports and before the page config
 
 def train_expense_predictor(transaction_data):
     """Train a model to predict monthly expenses based on historical data"""
-    # Prepare data
-    df = transaction_data.copy()
-    df['date'] = pd.to_datetime(df['date'])
-    df['month'] = df['date'].dt.month
-    df['day_of_week'] = df['date'].dt.dayofweek
+    # Shared date features, derived once per ledger version
+    df = get_transaction_features(transaction_data)
 
     # Only use expense records
-    expenses = df[df['type'] == 'expense'].copy()
+    expenses = df[df['type'] == 'expense']
 
     # Feature engineering
-    features = pd.get_dummies(expenses[['category', 'month', 'day_of_week']])
+    features = pd.get_dummies(expenses[['category', 'month', 'day_of_week']].assign(
+        category=expenses['category'].cat.remove_unused_categories()
+    ))
     target = expenses['amount'].abs()  # Use absolute value since expenses are negative
 
     # Train model
@@ -66,22 +67,100 @@ def predict_next_month_expenses(model, feature_names, transaction_data):
 
     return predictions
 
-def cluster_transactions(transaction_data):
+def sample_expenses_stratified(expenses, sample_size=5000, random_state=42):
+    """Draw a sample of expenses that keeps each category's share of the ledger"""
+    if len(expenses) <= sample_size:
+        return expenses
+
+    fraction = sample_size / len(expenses)
+    return expenses.groupby('category', group_keys=False).sample(frac=fraction, random_state=random_state)
+
+def score_cluster_count(features, n_clusters):
+    """Fit K-means with a candidate cluster count and return its silhouette score, or None if it can't be scored"""
+    labels = KMeans(n_clusters=n_clusters, random_state=42, n_init=3).fit_predict(features)
+
+    # Duplicate rows can leave K-means with fewer labels than asked for; silhouette needs 2..n-1
+    n_labels = len(np.unique(labels))
+    if n_labels < 2 or n_labels >= len(features):
+        return None
+    return silhouette_score(features, labels)
+
+def select_cluster_count(expenses, k_range=range(2, 9), sample_size=5000, default_k=3):
+    """Pick the number of spending clusters by silhouette score on a stratified sample"""
+    sample = sample_expenses_stratified(expenses, sample_size)
+    fallback = min(default_k, max(1, len(sample)))
+    if sample.empty:
+        return fallback
+
+    features = StandardScaler().fit_transform(build_cluster_features(sample, CLUSTER_BASE_FEATURES + CLUSTER_CATEGORIES))
+
+    # K-means can't find more clusters than there are distinct rows, and silhouette needs one spare row
+    n_distinct = len(np.unique(features, axis=0))
+    candidates = [k for k in k_range if k < min(n_distinct + 1, len(sample))]
+    if not candidates:
+        return fallback
+
+    # Candidate fits are independent, so run them in parallel
+    scores = Parallel(n_jobs=-1)(delayed(score_cluster_count)(features, k) for k in candidates)
+
+    scored = [(score, k) for score, k in zip(scores, candidates) if score is not None]
+    if not scored:
+        return fallback
+    return max(scored, key=lambda item: item[0])[1]
+
+def iter_expense_batches(transaction_data, batch_size=50000):
+    """Yield the expenses of each ledger slice with their derived features, one slice in memory at a time"""
+    for start in range(0, len(transaction_data), batch_size):
+        batch = derive_transaction_features(transaction_data.iloc[start:start + batch_size])
+        expenses = batch[batch['type'] == 'expense']
+        if not expenses.empty:
+            yield expenses
+
+def sample_expenses_batched(transaction_data, sample_size=5000, batch_size=50000, random_state=42):
+    """Stratified sample of the ledger's expenses, drawn slice by slice at one common fraction"""
+    n_expenses = sum(
+        int((transaction_data['type'].iloc[start:start + batch_size] == 'expense').sum())
+        for start in range(0, len(transaction_data), batch_size)
+    )
+    fraction = min(1.0, sample_size / n_expenses) if n_expenses else 1.0
+
+    samples = [
+        expenses.groupby('category', observed=True, group_keys=False).sample(frac=fraction, random_state=random_state)
+        for expenses in iter_expense_batches(transaction_data, batch_size)
+    ]
+    return pd.concat(samples) if samples else pd.DataFrame(columns=['category', 'amount_abs', 'day_of_month', 'day_of_week'])
+
+def get_cluster_count(transaction_data, batch_size=50000):
+    """Return the selected cluster count, recomputed only when the ledger changes"""
+    if 'cluster_count_cache' not in st.session_state:
+        st.session_state.cluster_count_cache = {}
+
+    version = get_ledger_version(transaction_data)
+    if version not in st.session_state.cluster_count_cache:
+        # Only the latest ledger version is worth keeping
+        sample = sample_expenses_batched(transaction_data, batch_size=batch_size)
+        st.session_state.cluster_count_cache = {version: select_cluster_count(sample)}
+
+    return st.session_state.cluster_count_cache[version]
+
+def cluster_transactions(transaction_data, streaming=False, batch_size=50000, n_clusters=None):
     """Cluster transactions to identify spending patterns"""
-    # Prepare data
-    df = transaction_data.copy()
+    # Choose the cluster count from the data unless one is given
+    if n_clusters is None:
+        n_clusters = get_cluster_count(transaction_data, batch_size)
 
-    # Filter to expenses only
-    expenses = df[df['type'] == 'expense'].copy()
+    # Large histories go through mini-batch K-means in bounded memory
+    if streaming:
+        return cluster_transactions_streaming(transaction_data, n_clusters=n_clusters, batch_size=batch_size)
 
-    # Feature engineering
-    expenses['date'] = pd.to_datetime(expenses['date'])
-    expenses['day_of_month'] = expenses['date'].dt.day
-    expenses['day_of_week'] = expenses['date'].dt.dayofweek
-    expenses['amount_abs'] = expenses['amount'].abs()
+    # Shared date features, derived once per ledger version
+    df = get_transaction_features(transaction_data)
+
+    # Filter to expenses only
+    expenses = df[df['type'] == 'expense']
 
     # Encode categories
-    cat_encoded = pd.get_dummies(expenses['category'])
+    cat_encoded = pd.get_dummies(expenses['category'].cat.remove_unused_categories())
 
     # Combine features
     features = pd.concat([
@@ -98,31 +177,156 @@ def cluster_transactions(transaction_data):
     features_pca = pca.fit_transform(features_scaled)
 
     # Apply K-means clustering
-    kmeans = KMeans(n_clusters=3, random_state=42)
+    kmeans = KMeans(n_clusters=min(n_clusters, len(features_pca)), random_state=42)
     clusters = kmeans.fit_predict(features_pca)
 
     # Add cluster information to original data
-    expenses['cluster'] = clusters
+    expenses = expenses.assign(cluster=clusters)
 
     return expenses, kmeans, scaler, pca
 
+# Fixed feature layout for streaming clusters so every batch lines up with the fitted model
+CLUSTER_BASE_FEATURES = ['amount_abs', 'day_of_month', 'day_of_week']
+CLUSTER_CATEGORIES = ["Groceries", "Dining", "Entertainment", "Transport", "Shopping", "Utilities", "Other"]
+
+def build_cluster_features(expenses, columns=None):
+    """Build the clustering feature matrix, optionally aligned to a fitted column layout"""
+    # Rows from the feature store already carry the date features
+    if 'day_of_month' not in expenses:
+        expenses = derive_transaction_features(expenses)
+
+    features = pd.DataFrame({
+        'amount_abs': expenses['amount_abs'].to_numpy(),
+        'day_of_month': expenses['day_of_month'].to_numpy(),
+        'day_of_week': expenses['day_of_week'].to_numpy()
+    })
+    cat_encoded = pd.get_dummies(expenses['category'].reset_index(drop=True))
+    features = pd.concat([features, cat_encoded], axis=1)
+
+    # Unknown categories drop out and missing ones are zero-filled
+    if columns is not None:
+        features = features.reindex(columns=columns, fill_value=0)
+
+    return features.astype(float)
+
+def update_transaction_clusters(cluster_model, transactions):
+    """Update scaler, PCA and mini-batch K-means with a new batch of transactions"""
+    expenses = transactions[transactions['type'] == 'expense']
+    if expenses.empty:
+        return cluster_model
+
+    scaler = cluster_model['scaler']
+    pca = cluster_model['pca']
+    kmeans = cluster_model['kmeans']
+
+    columns = getattr(scaler, 'feature_names_in_', CLUSTER_BASE_FEATURES + CLUSTER_CATEGORIES)
+    features = build_cluster_features(expenses, columns)
+
+    # Models fitted in batch mode cannot learn incrementally, they only predict
+    if hasattr(scaler, 'partial_fit'):
+        scaler.partial_fit(features)
+    features_scaled = scaler.transform(features)
+
+    # IncrementalPCA needs at least n_components rows per update
+    if hasattr(pca, 'partial_fit') and len(features_scaled) >= pca.n_components:
+        pca.partial_fit(features_scaled)
+    if not hasattr(pca, 'components_'):
+        return cluster_model
+
+    features_pca = pca.transform(features_scaled)
+
+    # The first K-means update needs at least one row per cluster
+    if hasattr(kmeans, 'partial_fit'):
+        if hasattr(kmeans, 'cluster_centers_') or len(features_pca) >= kmeans.n_clusters:
+            kmeans.partial_fit(features_pca)
+
+    return cluster_model
+
+def predict_transaction_clusters(cluster_model, transactions):
+    """Assign transactions to existing clusters without refitting"""
+    scaler = cluster_model['scaler']
+    features = build_cluster_features(transactions, scaler.feature_names_in_)
+    features_pca = cluster_model['pca'].transform(scaler.transform(features))
+    return cluster_model['kmeans'].predict(features_pca)
+
+# Columns kept for each clustered expense, enough for the spending insights
+CLUSTER_DATA_COLUMNS = ['date', 'category', 'amount_abs', 'cluster']
+
+def cluster_transactions_streaming(transaction_data, n_clusters=3, batch_size=50000):
+    """
+    Cluster transactions batch by batch so memory stays bounded by the batch size.
+    Features are derived per ledger slice, so no full-ledger feature frame is built;
+    only the compact labelled expenses grow with the history.
+    """
+    columns = CLUSTER_BASE_FEATURES + CLUSTER_CATEGORIES
+    cluster_model = {
+        'scaler': StandardScaler(),
+        'pca': IncrementalPCA(n_components=min(5, len(columns))),
+        'kmeans': MiniBatchKMeans(n_clusters=n_clusters, random_state=42, n_init=3)
+    }
+
+    # Single pass: each batch refines the scaler, the projection and the centroids
+    for expenses in iter_expense_batches(transaction_data, batch_size):
+        update_transaction_clusters(cluster_model, expenses)
+
+    # Label the history through the cheap predict path, one batch at a time
+    labelled = []
+    if hasattr(cluster_model['kmeans'], 'cluster_centers_'):
+        for expenses in iter_expense_batches(transaction_data, batch_size):
+            clusters = predict_transaction_clusters(cluster_model, expenses).astype(np.int32)
+            labelled.append(expenses.assign(cluster=clusters)[CLUSTER_DATA_COLUMNS])
+
+    if labelled:
+        expenses = pd.concat(labelled)
+        expenses['category'] = expenses['category'].astype('category')
+    else:
+        expenses = pd.DataFrame({column: pd.Series(dtype=float) for column in CLUSTER_DATA_COLUMNS})
+
+    return expenses, cluster_model['kmeans'], cluster_model['scaler'], cluster_model['pca']
+
+def add_transactions_to_clusters(spending_clusters, new_transactions):
+    """Fold newly added transactions into the stored clusters and label them"""
+    update_transaction_clusters(spending_clusters, new_transactions)
+
+    new_features = derive_transaction_features(new_transactions)
+    new_expenses = new_features[new_features['type'] == 'expense']
+    if new_expenses.empty or not hasattr(spending_clusters['kmeans'], 'cluster_centers_'):
+        return spending_clusters
+
+    new_expenses = new_expenses.assign(cluster=predict_transaction_clusters(spending_clusters, new_expenses))[CLUSTER_DATA_COLUMNS]
+
+    spending_clusters['data'] = pd.concat([spending_clusters['data'], new_expenses], ignore_index=True)
+    return spending_clusters
+
 def generate_spending_insights(clustered_data):
     """Generate insights based on clustered transactions"""
     insights = []
 
-    # Analyze spending by cluster
-    cluster_stats = clustered_data.groupby('cluster').agg({
-        'amount_abs': ['mean', 'sum', 'count'],
-        'category': lambda x: x.value_counts().index[0],
-        'day_of_week': 'mean'
-    })
+    if clustered_data.empty:
+        return insights
+
+    # Build cluster x category count and spend matrices in a single vectorized pass
+    clusters = clustered_data['cluster'].to_numpy()
+    amounts = clustered_data['amount_abs'].to_numpy(dtype=float)
+    category_codes, category_names = pd.factorize(clustered_data['category'])
+
+    n_clusters = int(clusters.max()) + 1
+    n_categories = len(category_names)
+    cells = clusters * n_categories + category_codes
+
+    counts = np.bincount(cells, minlength=n_clusters * n_categories).reshape(n_clusters, n_categories)
+    totals = np.bincount(cells, weights=amounts, minlength=n_clusters * n_categories).reshape(n_clusters, n_categories)
+
+    cluster_counts = counts.sum(axis=1)
+    cluster_totals = totals.sum(axis=1)
+    top_categories = category_names[counts.argmax(axis=1)]
 
     # Generate insights
-    for cluster in cluster_stats.index:
-        count = cluster_stats.loc[cluster, ('amount_abs', 'count')]
-        total = cluster_stats.loc[cluster, ('amount_abs', 'sum')]
-        avg = cluster_stats.loc[cluster, ('amount_abs', 'mean')]
-        top_category = cluster_stats.loc[cluster, ('category', '<lambda>')]
+    for cluster in np.flatnonzero(cluster_counts):
+        count = cluster_counts[cluster]
+        total = cluster_totals[cluster]
+        avg = total / count
+        top_category = top_categories[cluster]
 
         # Frequent small expenses
         if count > 10 and avg < 20:
@@ -132,64 +336,126 @@ def generate_spending_insights(clustered_data):
         if count < 5 and avg > 100:
             insights.append(f"You have {count:.0f} large expenses on {top_category} averaging €{avg:.2f}. Consider budgeting €{total/3:.2f} monthly for these expenses.")
 
-    # Add general insights
-    cat_spending = clustered_data.groupby('category')['amount_abs'].sum().sort_values(ascending=False)
-    top_category = cat_spending.index[0]
-    top_amount = cat_spending.iloc[0]
+    # Add general insights from the same matrix
+    category_totals = totals.sum(axis=0)
+    top_index = category_totals.argmax()
+    top_category = category_names[top_index]
+    top_amount = category_totals[top_index]
 
-    insights.append(f"Your highest spending category is {top_category} at €{top_amount:.2f}. This represents {(top_amount/cat_spending.sum()*100):.1f}% of your expenses.")
+    insights.append(f"Your highest spending category is {top_category} at €{top_amount:.2f}. This represents {(top_amount/category_totals.sum()*100):.1f}% of your expenses.")
 
     return insights
 
-def build_budget_optimizer(transaction_data, target_savings):
-    """Build a model to optimize budget allocation"""
-    # Prepare data
-    df = transaction_data.copy()
-    expenses = df[df['type'] == 'expense'].copy()
-
-    # Get total expenses by category
-    category_totals = expenses.groupby('category')['amount'].sum().abs()
+# How readily each category is cut (higher cuts more), and the share of current spending it never goes below
+BUDGET_CUT_WEIGHTS = {
+    'Groceries': 0.3,
+    'Utilities': 0.3,
+    'Transport': 0.5,
+    'Dining': 0.8,
+    'Entertainment': 1.0,
+    'Shopping': 0.9
+}
+BUDGET_FLOORS = {
+    'Groceries': 0.8,
+    'Utilities': 0.9,
+    'Transport': 0.7,
+    'Dining': 0.4,
+    'Entertainment': 0.3,
+    'Shopping': 0.4
+}
+DEFAULT_CUT_WEIGHT = 0.7
+DEFAULT_FLOOR = 0.6
+
+def solve_budget_cuts(amounts, weights, floors, gaps):
+    """
+    Cheapest cuts per category that close each savings gap, for a whole array of gaps at once.
+    Sacrifice is sum(cut**2 / (amount * weight)): cutting deeper into a category costs more per euro,
+    so cuts spread across categories instead of emptying the cheapest one. Each cut stays within
+    amount * (1 - floor). Returns cuts (gaps x categories), their sacrifice and whether each gap closes.
+    """
+    amounts = np.asarray(amounts, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    gaps = np.atleast_1d(np.asarray(gaps, dtype=float)).clip(min=0)
+    caps = amounts * (1 - np.asarray(floors, dtype=float))
+
+    # At the optimum every unsaturated cut is lam * amount * weight / 2 for one multiplier lam,
+    # and a category saturates once lam passes 2 * (1 - floor) / weight
+    slopes = amounts * weights / 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        breakpoints = np.where(slopes > 0, caps / slopes, 0.0)
+    order = np.argsort(breakpoints)
+    breakpoints, slopes, caps_sorted = breakpoints[order], slopes[order], caps[order]
+
+    # Total cut at each breakpoint: saturated caps below it plus the open slopes times lam
+    saturated = np.concatenate([[0.0], np.cumsum(caps_sorted)])
+    open_slope = np.concatenate([[slopes.sum()], slopes.sum() - np.cumsum(slopes)])
+    totals_at = saturated[:-1] + open_slope[:-1] * breakpoints
+
+    # Locate each gap between breakpoints and solve the linear piece for lam
+    segment = np.searchsorted(totals_at, gaps)
+    feasible = gaps <= caps.sum() + 1e-9
+    segment_saturated = saturated[segment]
+    segment_slope = open_slope[segment]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        lam = np.where(segment_slope > 0, (gaps - segment_saturated) / segment_slope, np.inf)
+    lam = np.where(feasible, lam, np.inf)
+
+    cuts = np.minimum(lam[:, None] * (amounts * weights / 2)[None, :], caps[None, :])
+    cuts = np.where(np.isnan(cuts), 0.0, cuts)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sacrifice = np.where(cuts > 0, cuts ** 2 / (amounts * weights), 0.0).sum(axis=1)
+
+    return cuts, sacrifice, feasible
+
+def get_budget_inputs(transaction_data, days=90):
+    """Monthly income and per-category spending over a trailing window, with each category's weight and floor"""
+    index = get_window_index(transaction_data)
+    kpis = window_kpis(index, days)
+    months = kpis['covered_days'] / DAYS_PER_MONTH
+    category_totals = window_category_totals(index, days) / months if months else pd.Series(dtype=float)
+
+    weights = np.array([BUDGET_CUT_WEIGHTS.get(category, DEFAULT_CUT_WEIGHT) for category in category_totals.index])
+    floors = np.array([BUDGET_FLOORS.get(category, DEFAULT_FLOOR) for category in category_totals.index])
+
+    return kpis['monthly_income'], category_totals, weights, floors
 
-    # Calculate current total expenses
-    total_expenses = category_totals.sum()
-
-    # Calculate needed reduction to meet target savings
-    income = df[df['type'] == 'income']['amount'].sum()
-    current_savings = income - total_expenses
+def build_budget_optimizer(transaction_data, target_savings):
+    """Suggest monthly category budgets that reach a monthly savings target with the least sacrifice"""
+    monthly_income, category_totals, weights, floors = get_budget_inputs(transaction_data)
+    current_savings = monthly_income - category_totals.sum()
     savings_gap = target_savings - current_savings
 
     # If already saving enough
     if savings_gap <= 0:
         return None, None, current_savings
 
-    # Calculate % reduction needed in each category
-    # Exclude essentials with higher weights (lower reduction %)
-    category_weights = {
-        'Groceries': 0.3,
-        'Utilities': 0.3,
-        'Transport': 0.5,
-        'Dining': 0.8,
-        'Entertainment': 1.0,
-        'Shopping': 0.9
-    }
-
-    # Fill missing weights
-    for cat in category_totals.index:
-        if cat not in category_weights:
-            category_weights[cat] = 0.7
-
-    # Calculate suggested reductions
-    suggested_budget = {}
-    for category, amount in category_totals.items():
-        weight = category_weights.get(category, 0.7)
-        reduction = min(amount * 0.3 * weight, savings_gap * (amount / total_expenses))
-        suggested_budget[category] = amount - reduction
+    cuts, _, _ = solve_budget_cuts(category_totals.to_numpy(), weights, floors, savings_gap)
+    suggested_budget = dict(zip(category_totals.index, category_totals.to_numpy() - cuts[0]))
+    category_weights = dict(zip(category_totals.index, weights))
 
-    # Calculate new savings with this budget
-    new_savings = income - sum(suggested_budget.values())
+    # Short of the target when every category is already at its floor
+    new_savings = monthly_income - sum(suggested_budget.values())
 
     return suggested_budget, category_weights, new_savings
 
+def budget_savings_frontier(transaction_data, targets=None):
+    """Least sacrifice needed for each of a range of monthly savings targets, solved in one sweep"""
+    monthly_income, category_totals, weights, floors = get_budget_inputs(transaction_data)
+    current_savings = monthly_income - category_totals.sum()
+    if targets is None:
+        targets = current_savings + np.linspace(0, category_totals.sum() * (1 - floors).mean() if len(floors) else 0, 50)
+    targets = np.asarray(targets, dtype=float)
+
+    cuts, sacrifice, feasible = solve_budget_cuts(category_totals.to_numpy(), weights, floors, targets - current_savings)
+
+    return pd.DataFrame({
+        'target': targets,
+        'savings': current_savings + cuts.sum(axis=1),
+        'total_cut': cuts.sum(axis=1),
+        'sacrifice': sacrifice,
+        'feasible': feasible
+    })
+
 def predict_investment_returns(current_amount, monthly_contribution, years, risk_level):
     """Predict investment returns based on risk level"""
     # Define expected returns and volatility by risk level
@@ -293,46 +559,101 @@ def build_subscription_recommendation_model():
 
     return recommend_subscription
 
-def analyze_sentiment(text):
-    """Analyze sentiment in text using a simple lexicon-based approach"""
-    # Simple sentiment lexicon
-    positive_words = ['great', 'good', 'positive', 'excellent', 'profit', 'gain', 'increase', 'up', 'higher', 'growth']
-    negative_words = ['bad', 'poor', 'negative', 'loss', 'decrease', 'down', 'lower', 'decline', 'debt', 'worry']
+# Sentiment lexicon: word -> polarity, looked up in O(1)
+SENTIMENT_LEXICON = {
+    **{word: 1 for word in ['great', 'good', 'positive', 'excellent', 'profit', 'gain', 'increase', 'up', 'higher', 'growth']},
+    **{word: -1 for word in ['bad', 'poor', 'negative', 'loss', 'decrease', 'down', 'lower', 'decline', 'debt', 'worry']}
+}
+
+# Notes are split into words once; each word is then a dict lookup in the lexicon
+SENTIMENT_TOKEN_PATTERN = re.compile(r'\w+')
+SENTIMENT_THRESHOLD = 0.2
+
+def get_vader_analyzer():
+    """Load NLTK's VADER analyzer on first use, None when NLTK or its lexicon is unavailable"""
+    if 'vader_analyzer' not in st.session_state:
+        analyzer = None
+        try:
+            from nltk.sentiment.vader import SentimentIntensityAnalyzer
+            try:
+                analyzer = SentimentIntensityAnalyzer()
+            except LookupError:
+                import nltk
+                nltk.download('vader_lexicon', quiet=True)
+                analyzer = SentimentIntensityAnalyzer()
+        except Exception:
+            analyzer = None
+        st.session_state.vader_analyzer = analyzer
+    return st.session_state.vader_analyzer
+
+def classify_sentiment(scores):
+    """Label scores in [-1, 1] as positive, negative or neutral"""
+    return np.select([scores > SENTIMENT_THRESHOLD, scores < -SENTIMENT_THRESHOLD], ["positive", "negative"], "neutral")
+
+def count_sentiment_words(texts):
+    """Positive and negative lexicon hits per text, tokenizing each distinct lowercased text once"""
+    # Repeated notes are common, so only distinct texts are scanned
+    codes, uniques = pd.factorize(texts.str.lower())
+    positive = np.zeros(len(uniques), dtype=np.int64)
+    negative = np.zeros(len(uniques), dtype=np.int64)
+    for i, text in enumerate(uniques):
+        for token in SENTIMENT_TOKEN_PATTERN.findall(text):
+            polarity = SENTIMENT_LEXICON.get(token, 0)
+            if polarity > 0:
+                positive[i] += 1
+            elif polarity < 0:
+                negative[i] += 1
+    return positive[codes], negative[codes]
+
+def analyze_sentiment_batch(texts, backend="lexicon"):
+    """
+    Score many texts at once (transaction notes, assistant messages, news snippets).
+    The lexicon backend sums lexicon polarities over each text's words, scoring each distinct text once;
+    backend="vader" uses NLTK's VADER compound score and falls back to the lexicon if NLTK is not available.
+    Both backends report the lexicon word counts alongside the score.
+    """
+    texts = pd.Series(texts, dtype=object).fillna("").astype(str).reset_index(drop=True)
+    positive_count, negative_count = count_sentiment_words(texts)
+
+    analyzer = get_vader_analyzer() if backend == "vader" else None
+    if analyzer is not None:
+        scores = np.array([analyzer.polarity_scores(text)['compound'] for text in texts], dtype=float)
+    else:
+        # Calculate sentiment score (-1 to 1)
+        total_count = positive_count + negative_count
+        scores = np.divide(positive_count - negative_count, total_count, out=np.zeros(len(texts)), where=total_count > 0)
 
-    # Tokenize
-    words = re.findall(r'\w+', text.lower())
+    return pd.DataFrame({
+        'score': scores,
+        'classification': classify_sentiment(scores),
+        'positive_words': positive_count,
+        'negative_words': negative_count
+    })
 
-    # Count sentiment words
-    positive_count = sum(1 for word in words if word in positive_words)
-    negative_count = sum(1 for word in words if word in negative_words)
+def analyze_sentiment(text, backend="lexicon"):
+    """Analyze sentiment in a single text, see analyze_sentiment_batch"""
+    result = analyze_sentiment_batch([text], backend=backend).iloc[0]
+    return {key: (value.item() if hasattr(value, 'item') else value) for key, value in result.items()}
 
-    # Calculate sentiment score (-1 to 1)
-    total_count = positive_count + negative_count
-    if total_count > 0:
-        sentiment_score = (positive_count - negative_count) / total_count
-    else:
-        sentiment_score = 0
+def benchmark_sentiment(n_texts=100000, backend="lexicon", seed=42):
+    """Measure sentiment throughput in texts per second on synthetic notes"""
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array(list(SENTIMENT_LEXICON) + ['coffee', 'rent', 'salary', 'market', 'today', 'the', 'my', 'was'])
+    lengths = rng.integers(5, 20, n_texts)
+    words = vocabulary[rng.integers(0, len(vocabulary), lengths.sum())]
+    texts = [" ".join(chunk) for chunk in np.split(words, np.cumsum(lengths)[:-1])]
 
-    # Classify sentiment
-    if sentiment_score > 0.2:
-        sentiment = "positive"
-    elif sentiment_score < -0.2:
-        sentiment = "negative"
-    else:
-        sentiment = "neutral"
+    start = time.perf_counter()
+    analyze_sentiment_batch(texts, backend=backend)
+    elapsed = time.perf_counter() - start
 
-    return {
-        'score': sentiment_score,
-        'classification': sentiment,
-        'positive_words': positive_count,
-        'negative_words': negative_count
-    }
+    return {'texts': n_texts, 'seconds': elapsed, 'texts_per_second': n_texts / elapsed if elapsed > 0 else float('inf')}
 
 def create_financial_health_score(transaction_data, goals, balance, savings, investments):
     """Create a comprehensive financial health score"""
     # Calculate income and expenses
     total_income = transaction_data[transaction_data['type'] == 'income']['amount'].sum()
-    total_expenses = transaction_data[transaction_data['type'] == 'expense']['amount'].sum().abs()
+    total_expenses = abs(transaction_data[transaction_data['type'] == 'expense']['amount'].sum())
 
     # Calculate metrics
     if total_income > 0:
@@ -341,18 +662,14 @@ def create_financial_health_score(transaction_data, goals, balance, savings, inv
         savings_rate = 0
 
     # Emergency fund ratio (months of expenses covered)
-    monthly_expenses = total_expenses / 3  # Assuming 3 months of data
+    monthly_expenses = window_kpis(get_window_index(transaction_data), 90)['monthly_expenses']
     if monthly_expenses > 0:
         emergency_fund_ratio = savings / monthly_expenses
     else:
         emergency_fund_ratio = 0
 
-    # Goal progress
-    goal_progress = []
-    for goal in goals:
-        progress = (goal['current'] / goal['target']) * 100
-        goal_progress.append(progress)
-    avg_goal_progress = sum(goal_progress) / len(goal_progress) if goal_progress else 0
+    # Goal progress, read from the running goal metrics for the session's goal store
+    avg_goal_progress = average_goal_progress(goals)
 
     # Investment ratio (investments to total assets)
     total_assets = balance + savings + investments
@@ -386,40 +703,42 @@ def create_financial_health_score(transaction_data, goals, balance, savings, inv
         'components': scores
     }
 
-def generate_custom_insights(transaction_data, financial_health):
-    """Generate personalized insights based on transaction data and financial health"""
-    insights = []
-
-    # Analyze spending patterns
-    df = transaction_data.copy()
-    expenses = df[df['type'] == 'expense'].copy()
+def build_period_spending(transaction_data, freq="M"):
+    """Pivot expenses into a period x category spending table, periods are year-aware ("M", "W", "Q", "Y")"""
+    df = get_transaction_features(transaction_data)
+    expenses = df[df['type'] == 'expense']
 
-    # Convert date to datetime
-    expenses['date'] = pd.to_datetime(expenses['date'])
-    expenses['month'] = expenses['date'].dt.month
-    expenses['week'] = expenses['date'].dt.isocalendar().week
-    expenses['amount_abs'] = expenses['amount'].abs()
+    periods = expenses['date'].dt.to_period(freq).rename('period')
+    return expenses.groupby([periods, 'category'], observed=True)['amount_abs'].sum().unstack(fill_value=0.0)
 
-    # Get monthly spending
-    current_month = datetime.now().month
-    prev_month = current_month - 1 if current_month > 1 else 12
+def compare_spending_periods(period_spending, current, previous):
+    """
+    Category deltas between two periods of a period spending table, all categories at once.
+    Any pair works on the same table: month over month, year over year (current - 12), etc.
+    """
+    both = period_spending.reindex([pd.Period(current), pd.Period(previous)], fill_value=0.0)
+    comparison = pd.DataFrame({'current': both.iloc[0], 'previous': both.iloc[1]})
+    comparison['change'] = comparison['current'] - comparison['previous']
+    comparison['change_pct'] = comparison['change'] / comparison['previous'].where(comparison['previous'] > 0) * 100
 
-    current_month_data = expenses[expenses['month'] == current_month]
-    prev_month_data = expenses[expenses['month'] == prev_month]
+    return comparison
 
-    # Category comparisons
-    if not current_month_data.empty and not prev_month_data.empty:
-        for category in expenses['category'].unique():
-            curr_cat = current_month_data[current_month_data['category'] == category]['amount_abs'].sum()
-            prev_cat = prev_month_data[prev_month_data['category'] == category]['amount_abs'].sum()
+def generate_custom_insights(transaction_data, financial_health):
+    """Generate personalized insights based on transaction data and financial health"""
+    insights = []
 
-            if prev_cat > 0:
-                change_pct = (curr_cat - prev_cat) / prev_cat * 100
+    # Compare this calendar month with the previous one, keyed by year and month
+    period_spending = build_period_spending(transaction_data, freq="M")
+    current_month = pd.Period(datetime.now(), freq="M")
+    comparison = compare_spending_periods(period_spending, current_month, current_month - 1)
 
-                if change_pct > 20:
-                    insights.append(f"Your spending on {category} has increased by {change_pct:.1f}% this month.")
-                elif change_pct < -20:
-                    insights.append(f"Great job! You've reduced your {category} spending by {-change_pct:.1f}% this month.")
+    # Category comparisons
+    if comparison['current'].sum() > 0 and comparison['previous'].sum() > 0:
+        for category, change_pct in comparison['change_pct'].dropna().items():
+            if change_pct > 20:
+                insights.append(f"Your spending on {category} has increased by {change_pct:.1f}% this month.")
+            elif change_pct < -20:
+                insights.append(f"Great job! You've reduced your {category} spending by {-change_pct:.1f}% this month.")
 
     # Savings insights
     savings_rate_score = financial_health['components']['Savings Rate']
@@ -478,7 +797,8 @@ def initialize_ml_models():
         expense_model, feature_names = train_expense_predictor(st.session_state.transactions)
 
         # Clustering model for spending patterns
-        clustered_transactions, kmeans_model, scaler, pca = cluster_transactions(st.session_state.transactions)
+        # Streaming mode keeps the clusters updatable as new transactions arrive
+        clustered_transactions, kmeans_model, scaler, pca = cluster_transactions(st.session_state.transactions, streaming=True)
 
         # Budget optimizer
         target_monthly_savings = 300  # Example target
@@ -611,7 +931,7 @@ def display_dashboard():
             total_predicted = sum(predictions.values())
 
             # Calculate predicted savings
-            monthly_income = st.session_state.transactions[st.session_state.transactions['type'] == 'income']['amount'].sum() / 3
+            monthly_income = window_kpis(get_window_index(st.session_state.transactions), 90)['monthly_income']
             predicted_savings = monthly_income - total_predicted
 
             st.markdown(f"""
@@ -713,18 +1033,21 @@ def display_dashboard():
 
     col1, col2 = st.columns(2)
 
-    for i, goal in enumerate(st.session_state.goals):
+    # Completion forecasts for all goals from their contribution history
+    goal_forecast = forecast_goals(st.session_state.goals)
+
+    for i, (goal_id, goal) in enumerate(st.session_state.goals.items()):
         progress = (goal["current"] / goal["target"]) * 100
+        forecast = goal_forecast.loc[goal_id]
+        target_date = goal.get("date", "Not set")
 
         # AI prediction for goal completion
-        monthly_contribution = goal["current"] / 3  # Rough estimate
-        months_to_complete = (goal["target"] - goal["current"]) / monthly_contribution if monthly_contribution > 0 else float('inf')
-
-        if months_to_complete != float('inf'):
-            estimated_completion = datetime.now() + timedelta(days=30 * months_to_complete)
-            completion_date = estimated_completion.strftime("%Y-%m-%d")
-            target_date = goal.get("target_date", "Not set")
-            ai_prediction = f"AI predicts completion by {completion_date}" if months_to_complete < 36 else "Long-term goal"
+        if forecast["remaining"] <= 0:
+            ai_prediction = "Goal reached"
+        elif pd.notna(forecast["projected_date"]):
+            months_to_complete = (forecast["projected_date"] - pd.Timestamp.now()).days / 30.44
+            ai_prediction = (f"AI predicts completion by {forecast['projected_date']:%Y-%m-%d} "
+                             f"({forecast['on_time_probability']:.0%} chance by the target date)") if months_to_complete < 36 else "Long-term goal"
         else:
             ai_prediction = "Need more contributions to estimate"
 
@@ -851,55 +1174,86 @@ def display_dashboard():
             # AI-based budgeting advice
     st.markdown("<h3>Smart Budget Recommendations</h3>", unsafe_allow_html=True)
 
-    # Check for spending patterns
-    if len(st.session_state.transactions) > 10:
-        # Calculate average spending by category
-        category_spending = {}
-        for transaction in st.session_state.transactions:
-            category = transaction.get("category", "Other")
-            amount = transaction.get("amount", 0)
-            if amount < 0:  # Only count expenses
-                category_spending[category] = category_spending.get(category, 0) + abs(amount)
+    # Savings versus sacrifice across a range of monthly targets
+    frontier = budget_savings_frontier(st.session_state.transactions)
+    frontier = frontier[frontier['feasible']]
+    if len(frontier) > 1:
+        fig = px.line(
+            frontier,
+            x='savings',
+            y='sacrifice',
+            labels={'savings': 'Monthly Savings (€)', 'sacrifice': 'Sacrifice (weighted €)'},
+            template='plotly_white'
+        )
+        fig.update_layout(height=300, margin=dict(l=20, r=20, t=20, b=20))
+        st.plotly_chart(fig, use_container_width=True)
+        st.caption("Each point is the gentlest set of category cuts that reaches that monthly savings, keeping essentials above their floors.")
 
-        # Find top spending categories
-        top_categories = sorted(category_spending.items(), key=lambda x: x[1], reverse=True)[:3]
+    # Budget envelopes, read from the running totals kept as transactions are added
+    envelopes = get_budget_envelopes(st.session_state.transactions)
+    statuses = budget_overview(envelopes)
 
-        col1, col2 = st.columns([1, 1])
+    col1, col2 = st.columns([1, 1])
 
-        with col1:
-            st.markdown("""
-            <div style="padding: 1rem; background-color: #f8f9fa; border-radius: 10px; margin-bottom: 1rem;">
-                <h4 style="margin-top: 0;">Top Spending Categories</h4>
-            """, unsafe_allow_html=True)
+    with col1:
+        st.markdown("""
+        <div style="padding: 1rem; background-color: #f8f9fa; border-radius: 10px; margin-bottom: 1rem;">
+            <h4 style="margin-top: 0;">Monthly Budgets</h4>
+        """, unsafe_allow_html=True)
 
-            for category, amount in top_categories:
+        if statuses:
+            for status in statuses:
+                color = "#dc3545" if status["overspent"] else "#28a745"
+                rollover = f" (incl. €{status['carry']:.2f} rolled over)" if status["carry"] else ""
                 st.markdown(f"""
-                <div style="display: flex; justify-content: space-between; margin-bottom: 0.5rem;">
-                    <span>{category}</span>
-                    <span>€{amount:.2f}</span>
+                <div style="display: flex; justify-content: space-between; margin-bottom: 0.25rem;">
+                    <span>{status['category']}</span>
+                    <span style="color: {color};">€{status['spent']:.2f} / €{status['available']:.2f}{rollover}</span>
                 </div>
                 """, unsafe_allow_html=True)
+                share = status["spent"] / status["available"] if status["available"] > 0 else 1.0
+                st.progress(min(max(share, 0.0), 1.0))
+        else:
+            st.markdown("<p>No budgets set yet. Set a monthly budget per category below.</p>", unsafe_allow_html=True)
 
-            st.markdown("</div>", unsafe_allow_html=True)
+        st.markdown("</div>", unsafe_allow_html=True)
 
-        with col2:
-            # Budget optimization suggestion
-            total_expenses = sum(abs(t["amount"]) for t in st.session_state.transactions if t["amount"] < 0)
-            monthly_income = sum(t["amount"] for t in st.session_state.transactions if t["amount"] > 0)
-            savings_rate = 0 if monthly_income == 0 else (monthly_income - total_expenses) / monthly_income
+    with col2:
+        # Budget optimization suggestion
+        kpis = window_kpis(get_window_index(st.session_state.transactions), 30)
+        savings_rate = kpis['savings_rate'] / 100
+        overspent = [status["category"] for status in statuses if status["overspent"]]
 
-            st.markdown(f"""
-            <div style="padding: 1rem; background-color: #f0f7ff; border-radius: 10px;">
-                <h4 style="margin-top: 0;">AI Budget Insights</h4>
-                <p style="margin: 0;">Your savings rate: <strong>{savings_rate:.1%}</strong></p>
-                <p style="margin-top: 0.5rem;">
-                    {"Great job! Your savings rate is healthy." if savings_rate > 0.2 else
-                     "Consider reducing spending in your top categories to improve your savings rate."}
-                </p>
-            </div>
-            """, unsafe_allow_html=True)
-    else:
-        st.info("Add more transactions to get personalized budget recommendations.")
+        st.markdown(f"""
+        <div style="padding: 1rem; background-color: #f0f7ff; border-radius: 10px;">
+            <h4 style="margin-top: 0;">AI Budget Insights</h4>
+            <p style="margin: 0;">Your savings rate: <strong>{savings_rate:.1%}</strong></p>
+            <p style="margin-top: 0.5rem;">
+                {f"You're over budget on {', '.join(overspent)} this month." if overspent else
+                 "Great job! Your savings rate is healthy." if savings_rate > 0.2 else
+                 "Consider reducing spending in your top categories to improve your savings rate."}
+            </p>
+        </div>
+        """, unsafe_allow_html=True)
+
+    with st.expander("Set monthly budgets"):
+        with st.form("budget_limits_form"):
+            budget_category = st.selectbox("Category", [category for category in TRANSACTION_CATEGORIES if category != "Income"])
+            budget_limit = st.number_input(
+                "Monthly budget (€)", min_value=0.0, step=10.0,
+                value=st.session_state.budget_limits.get(budget_category, 0.0)
+            )
+
+            if st.form_submit_button("Save Budget"):
+                set_budget_limit(budget_category, budget_limit)
+                st.rerun()
+
+        # The optimizer's suggestion makes a starting set of envelopes
+        suggested_budget = st.session_state.ml_models['budget_optimizer']['suggested_budget']
+        if suggested_budget and st.button("Use suggested budgets"):
+            for category, limit in suggested_budget.items():
+                set_budget_limit(category, round(limit, 2))
+            st.rerun()
 
     # Financial health score
     st.markdown("<h3>Financial Health Score</h3>", unsafe_allow_html=True)
@@ -921,8 +1275,7 @@ def display_dashboard():
     # Goals progress
     goals_progress = 0
     if st.session_state.goals:
-        goal_progress_sum = sum(goal["current"] / max(1, goal["target"]) for goal in st.session_state.goals)
-        goals_progress = goal_progress_sum / len(st.session_state.goals)
+        goals_progress = average_goal_progress() / 100
 
     # Calculate health score (0-100)
     health_score = min(100, max(0,
@@ -14,9 +14,22 @@ import plotly.express as px
 from PIL import Image
 from datetime import datetime, timedelta
 import random
-from sklearn.linear_model import LinearRegression
 import time
 import json
+import re
+import os
+import uuid
+import shutil
+import hashlib
+import hmac
+from collections import OrderedDict, deque
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
+from scipy.signal import lfilter
+
+# Copy-on-write lets read views share memory with the ledger (always on from pandas 3)
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
 
 # Set page configuration
 st.set_page_config(
@@ -119,9 +132,15 @@ if 'savings' not in st.session_state:
 if 'investments' not in st.session_state:
     st.session_state.investments = 0.0
 if 'goals' not in st.session_state:
-    st.session_state.goals = []
+    st.session_state.goals = {}  # Goal id -> goal, see the goal store
+if 'goal_metrics' not in st.session_state:
+    st.session_state.goal_metrics = {'count': 0, 'progress_sum': 0.0}
+if 'goals_version' not in st.session_state:
+    st.session_state.goals_version = 0  # Bumped whenever goals change, keys cached answers
 if 'transactions' not in st.session_state:
     st.session_state.transactions = pd.DataFrame(columns=["date", "category", "amount", "description", "type"])
+if 'ledger_version' not in st.session_state:
+    st.session_state.ledger_version = 0  # Bumped whenever transactions change, keys model caches
 if 'insights' not in st.session_state:
     st.session_state.insights = []
 if 'roundups' not in st.session_state:
@@ -130,6 +149,172 @@ if 'first_login' not in st.session_state:
     st.session_state.first_login = True
 if 'risk_profile' not in st.session_state:
     st.session_state.risk_profile = 'Moderate'
+if 'budget_limits' not in st.session_state:
+    st.session_state.budget_limits = {}  # Category -> monthly envelope
+
+# Ledger versioning
+def get_ledger_version(transaction_data):
+    """Return a key that changes whenever the ledger changes, used to cache models"""
+    # The session ledger carries a counter bumped on every insert
+    if 'transactions' in st.session_state and transaction_data is st.session_state.transactions:
+        return ('session', st.session_state.get('ledger_version', 0))
+
+    # Any other frame is fingerprinted by hashing its rows
+    row_hashes = pd.util.hash_pandas_object(transaction_data[['date', 'category', 'amount', 'type']], index=False)
+    return ('hash', len(transaction_data), int(row_hashes.sum()))
+
+# Read-only ledger views
+def get_ledger_view(transaction_data):
+    """Return a view of the ledger that shares its memory; columns added to it are copied on write"""
+    return transaction_data.copy(deep=False)
+
+# Shared feature store for date-derived transaction columns
+def derive_transaction_features(transaction_data):
+    """Derive compact date and amount features for a frame of transactions"""
+    dates = pd.to_datetime(transaction_data['date'])
+    return pd.DataFrame({
+        'date': dates,
+        'category': transaction_data['category'].astype('category'),
+        'amount': transaction_data['amount'].astype(float),
+        'type': transaction_data['type'].astype('category'),
+        'year': dates.dt.year.astype(np.int16),
+        'month': dates.dt.month.astype(np.int8),
+        'week': dates.dt.isocalendar().week.astype(np.int8),
+        'day_of_month': dates.dt.day.astype(np.int8),
+        'day_of_week': dates.dt.dayofweek.astype(np.int8),
+        'amount_abs': transaction_data['amount'].abs().astype(float)
+    }, index=transaction_data.index)
+
+def get_transaction_features(transaction_data):
+    """Return the date-derived features of a ledger, computed once per ledger version"""
+    # Only the session ledger is worth caching, other frames are derived directly
+    version = get_ledger_version(transaction_data)
+    if version[0] != 'session':
+        return derive_transaction_features(transaction_data)
+
+    store = st.session_state.get('feature_store')
+    if store is None or store['version'] != version:
+        store = {'version': version, 'features': derive_transaction_features(transaction_data)}
+        st.session_state.feature_store = store
+
+    # Shallow copy so callers can add columns without touching the shared store
+    return store['features'].copy(deep=False)
+
+# Rolling-window KPIs from daily prefix sums
+KPI_WINDOWS = (7, 30, 90, 365)
+DAYS_PER_MONTH = 30.44
+
+def build_window_index(transaction_data):
+    """
+    Build cumulative daily totals per (type, category) so any trailing window is a difference
+    of two rows. Row d holds everything dated before day d, counted from the first transaction.
+    """
+    features = get_transaction_features(transaction_data)
+    if features.empty:
+        return None
+
+    days = features['date'].dt.normalize()
+    start = days.min()
+    day_offsets = (days - start).dt.days.to_numpy()
+    n_days = int(day_offsets.max()) + 1
+
+    # Every (type, category) pair gets a column, straight from the categorical codes
+    types = features['type'].cat.categories.astype(str)
+    categories = features['category'].cat.categories.astype(str)
+    keys = pd.MultiIndex.from_product([types, categories], names=['type', 'category'])
+    key_codes = features['type'].cat.codes.to_numpy(np.int64) * len(categories) + features['category'].cat.codes.to_numpy(np.int64)
+    cells = day_offsets * len(keys) + key_codes
+
+    # One bincount per measure gives the day x key matrix, the running sum turns it into prefix sums
+    amounts = np.bincount(cells, weights=features['amount_abs'].to_numpy(), minlength=n_days * len(keys))
+    counts = np.bincount(cells, minlength=n_days * len(keys))
+    zero_row = np.zeros((1, len(keys)))
+
+    return {
+        'start': start,
+        'n_days': n_days,
+        'keys': keys,
+        'key_types': keys.get_level_values('type').to_numpy(),
+        'key_categories': keys.get_level_values('category').to_numpy(),
+        'amount': np.vstack([zero_row, np.cumsum(amounts.reshape(n_days, len(keys)), axis=0)]),
+        'count': np.vstack([zero_row, np.cumsum(counts.reshape(n_days, len(keys)), axis=0)])
+    }
+
+def get_window_index(transaction_data):
+    """Return the prefix-sum index of a ledger, rebuilt only when the ledger version changes"""
+    version = get_ledger_version(transaction_data)
+    if version[0] != 'session':
+        return build_window_index(transaction_data)
+
+    cache = st.session_state.get('window_index')
+    if cache is None or cache['version'] != version:
+        cache = {'version': version, 'index': build_window_index(transaction_data)}
+        st.session_state.window_index = cache
+
+    return cache['index']
+
+def window_bounds(index, days, end=None):
+    """Prefix rows delimiting the trailing days up to and including end (today by default)"""
+    end = pd.Timestamp(end if end is not None else datetime.now()).normalize()
+    stop = int(np.clip((end - index['start']).days + 1, 0, index['n_days']))
+    begin = int(np.clip(stop - days, 0, index['n_days'])) if stop > 0 else 0
+    return begin, stop
+
+def window_totals(index, days, end=None, tx_type=None, category=None):
+    """
+    Total absolute amount and transaction count over the trailing days up to and including end
+    (today by default), optionally restricted to a type and/or category. O(1) in the ledger size.
+    """
+    if index is None:
+        return 0.0, 0
+
+    begin, stop = window_bounds(index, days, end)
+
+    columns = np.ones(len(index['keys']), dtype=bool)
+    if tx_type is not None:
+        columns &= index['key_types'] == tx_type
+    if category is not None:
+        columns &= index['key_categories'] == category
+
+    amount = index['amount'][stop, columns].sum() - index['amount'][begin, columns].sum()
+    count = index['count'][stop, columns].sum() - index['count'][begin, columns].sum()
+    return float(amount), int(count)
+
+def window_category_totals(index, days, end=None, tx_type='expense'):
+    """Total absolute amount per category over a trailing window, largest first"""
+    if index is None:
+        return pd.Series(dtype=float)
+
+    begin, stop = window_bounds(index, days, end)
+    columns = index['key_types'] == tx_type
+    totals = pd.Series(index['amount'][stop, columns] - index['amount'][begin, columns], index=index['key_categories'][columns])
+
+    return totals[totals > 0].sort_values(ascending=False)
+
+def window_kpis(index, days, end=None):
+    """Income, spending and savings over a trailing window, with monthly rates over the days actually covered"""
+    end = pd.Timestamp(end if end is not None else datetime.now()).normalize()
+    income, _ = window_totals(index, days, end, tx_type='income')
+    expenses, n_expenses = window_totals(index, days, end, tx_type='expense')
+
+    # A ledger younger than the window only covers part of it
+    covered_days = 0
+    if index is not None:
+        covered_days = int(np.clip((end - index['start']).days + 1, 0, days))
+    months = covered_days / DAYS_PER_MONTH
+
+    return {
+        'days': days,
+        'covered_days': covered_days,
+        'income': income,
+        'expenses': expenses,
+        'net': income - expenses,
+        'savings_rate': (income - expenses) / income * 100 if income > 0 else 0.0,
+        'expense_count': n_expenses,
+        'avg_daily_spend': expenses / covered_days if covered_days else 0.0,
+        'monthly_income': income / months if months else 0.0,
+        'monthly_expenses': expenses / months if months else 0.0
+    }
 
 # Navigation function
 def navigate_to(page):
@@ -147,9 +332,13 @@ def login():
         password = st.text_input("Password", type="password")
 
         if st.button("Login"):
-            if username and password:  # Simple validation
+            user_id = authenticate_user(username, password) if username and password else None
+            if user_id:
                 st.session_state.login_status = True
 
+                # Restore goals saved by an earlier session
+                start_user_session(user_id, username)
+
                 # If this is the first login, navigate to the onboarding page
                 if st.session_state.first_login:
                     st.session_state.current_page = 'onboarding'
@@ -157,8 +346,10 @@ def login():
                     st.session_state.current_page = 'dashboard'
 
                 st.rerun()
-            else:
+            elif not username or not password:
                 st.error("Please enter both username and password")
+            else:
+                st.error("Incorrect username or password")
 
         st.markdown("<div style='text-align: center; margin-top: 1rem;'>", unsafe_allow_html=True)
         st.markdown("<a href='#' style='color: #4A90E2; text-decoration: none;'>Forgot password?</a>", unsafe_allow_html=True)
@@ -207,13 +398,16 @@ def onboarding():
             st.info("Add your most recent transactions to get started. You can add more later.")
 
             transaction_date = st.date_input("Date", value=datetime.now())
-            transaction_category = st.selectbox("Category", ["Income", "Groceries", "Dining", "Entertainment", "Transport", "Shopping", "Utilities", "Other"])
+            transaction_category = st.selectbox("Category", TRANSACTION_CATEGORIES)
             transaction_amount = st.number_input("Amount", value=0.0, step=10.0)
             transaction_description = st.text_input("Description")
 
             submit_button = st.form_submit_button("Add Transaction")
 
             if submit_button:
+                # Every category the user picks teaches the categorizer
+                learn_transaction_categories([transaction_description], [transaction_category])
+
                 # Determine transaction type
                 tx_type = "income" if transaction_category == "Income" else "expense"
                 tx_amount = transaction_amount if tx_type == "income" else -transaction_amount
@@ -232,6 +426,8 @@ def onboarding():
                     st.session_state.transactions = new_tx
                 else:
                     st.session_state.transactions = pd.concat([st.session_state.transactions, new_tx], ignore_index=True)
+                st.session_state.ledger_version += 1
+                get_budget_envelopes(st.session_state.transactions)
 
                 st.success("Transaction added!")
 
@@ -254,21 +450,14 @@ def onboarding():
             submit_goal = st.form_submit_button("Add Goal")
 
             if submit_goal and goal_name:
-                # Add the goal to session state
-                new_goal = {
-                    "name": goal_name,
-                    "target": goal_target,
-                    "current": goal_current,
-                    "date": goal_date.strftime("%Y-%m-%d")
-                }
-
-                st.session_state.goals.append(new_goal)
+                # Add the goal to the goal store
+                add_goal(goal_name, goal_target, goal_current, goal_date.strftime("%Y-%m-%d"))
                 st.success(f"Goal '{goal_name}' added!")
 
         # Display added goals
         if st.session_state.goals:
             st.subheader("Your Goals")
-            for i, goal in enumerate(st.session_state.goals):
+            for goal in st.session_state.goals.values():
                 progress = (goal["current"] / goal["target"]) * 100
 
                 st.markdown(f"""
@@ -329,7 +518,14 @@ def intelligent_fund_allocation():
     
     if 'risk_profile' in st.session_state:
         allocation = allocate_funds()
-        st.success(f"Funds allocated based on your risk profile '{st.session_state.risk_profile}': {allocation['monthly_allocation']}")
+        st.success(f"Funds allocated based on your risk profile '{st.session_state.risk_profile}'")
+        if allocation['monthly_allocation']:
+            st.dataframe(pd.DataFrame({
+                "Goal": [allocation['goal_names'][goal_id] for goal_id in allocation['monthly_allocation']],
+                "Monthly (€)": list(allocation['monthly_allocation'].values()),
+                "On schedule": [goal_id in allocation['on_time_goals'] for goal_id in allocation['monthly_allocation']]
+            }), use_container_width=True, hide_index=True)
+            st.caption(f"{len(allocation['on_time_goals'])} of {len(allocation['monthly_allocation'])} goals on schedule at €{allocation['total_monthly_savings']:.2f} a month.")
     else:
         st.warning("Please set your risk profile first.")
 # Function to connect to bank account and fetch transactions
@@ -352,7 +548,7 @@ def connect_bank_account():
         ]
 
         print(f"Successfully retrieved {len(transactions)} transactions")
-        return transactions
+        return categorize_bank_transactions(transactions)
     except Exception as e:
         print(f"Error connecting to bank account: {str(e)}")
         return []
@@ -387,7 +583,7 @@ def analyze_cash_flow(transactions):
             categories[category] += expense_amount
 
     # Calculate potential savings based on discretionary spending
-    essential_categories = {"housing", "utilities", "groceries", "healthcare", "transportation"}
+    essential_categories = {"Groceries", "Utilities", "Transport"}
     essential_expenses = sum(categories.get(cat, 0) for cat in essential_categories)
     discretionary_expenses = expenses - essential_expenses
 
@@ -422,63 +618,835 @@ def add_transaction_with_roundup(transaction):
     print(f"Transaction of ${amount:.2f} recorded with ${roundup:.2f} roundup savings")
     return {"transaction": transaction, "roundup": roundup}
 
+# Pay cycles recognised in income history, with their average length in days
+PAY_CYCLES = {"weekly": 7, "biweekly": 14, "semi-monthly": 15.22, "monthly": 30.44}
+
+# Function to detect pay cycles for many users at once
+def detect_pay_cycles(income):
+    """
+    Detects each user's pay cycle from their whole income history.
+    income has one row per deposit with user and date columns.
+    Returns one row per user with the cycle, a 0-1 confidence, the last payday and the days of month paid on.
+    """
+    income = income.sort_values(["user", "date"])
+    codes, users = pd.factorize(income["user"], sort=True)
+    dates = income["date"].to_numpy(dtype="datetime64[D]")
+    n_users = len(users)
+
+    # Interval histogram per user, gaps capped at 62 days
+    gap_bins = 63
+    same_user = codes[1:] == codes[:-1]
+    gaps = np.clip(np.diff(dates).astype(np.int64)[same_user], 0, gap_bins - 1)
+    gap_hist = np.bincount(codes[1:][same_user] * gap_bins + gaps, minlength=n_users * gap_bins).reshape(n_users, gap_bins)
+    n_gaps = gap_hist.sum(axis=1)
+
+    def gap_share(low, high):
+        return gap_hist[:, low:high + 1].sum(axis=1) / np.maximum(n_gaps, 1)
+
+    weekly = gap_share(5, 9)
+    fortnightly = gap_share(12, 17)
+    monthly = gap_share(26, 34)
+
+    # Day-of-month histogram, month ends share one bucket
+    day_of_month = np.where(income["date"].dt.is_month_end, 31, income["date"].dt.day).astype(np.int64)
+    day_hist = np.bincount(codes * 32 + day_of_month, minlength=n_users * 32).reshape(n_users, 32)
+    top_days = np.argsort(day_hist, axis=1, kind="stable")[:, -2:]
+    fixed_days = np.take_along_axis(day_hist, top_days, axis=1).sum(axis=1) / np.maximum(day_hist.sum(axis=1), 1)
+
+    # Biweekly pay is exactly 14 days apart and drifts through the month,
+    # semi-monthly pay sticks to two days of the month
+    exact_fortnight = gap_hist[:, 14] / np.maximum(gap_hist[:, 12:18].sum(axis=1), 1)
+    biweekly_evidence = (exact_fortnight + (1 - fixed_days)) / 2
+
+    scores = np.column_stack([
+        weekly,
+        fortnightly * biweekly_evidence,
+        fortnightly * (1 - biweekly_evidence),
+        monthly
+    ])
+    best = scores.argmax(axis=1)
+    confidence = np.where(n_gaps > 0, scores[np.arange(n_users), best], 0.0)
+    cycle = np.where(confidence > 0, np.array(list(PAY_CYCLES))[best], None)
+
+    last_rows = np.r_[np.flatnonzero(codes[1:] != codes[:-1]), len(codes) - 1]
+
+    return pd.DataFrame({
+        "cycle": cycle,
+        "confidence": confidence.round(2),
+        "last_payday": dates[last_rows],
+        "first_day": top_days[:, 1],
+        "second_day": top_days[:, 0]
+    }, index=users)
+
+# Function to project upcoming paydays aligned to each detected cycle
+def next_paydays(cycles, today, n_paydays=4, default_cycle="biweekly"):
+    """
+    Projects each user's next paydays after today.
+    Users without a detected cycle fall back to default_cycle.
+    Returns a users x n_paydays array of dates.
+    """
+    today = np.datetime64(pd.Timestamp(today).normalize(), "D")
+    cycle = cycles["cycle"].fillna(default_cycle).to_numpy()
+    last = cycles["last_payday"].to_numpy(dtype="datetime64[D]")
+    paydays = np.empty((len(cycles), n_paydays), dtype="datetime64[D]")
+
+    # Weekly and biweekly pay repeats a fixed number of days after the last payday
+    for name in ["weekly", "biweekly"]:
+        rows = cycle == name
+        step = PAY_CYCLES[name]
+        elapsed = np.maximum((today - last[rows]).astype(np.int64), 0)
+        first_step = elapsed // step + 1
+        steps = (first_step[:, None] + np.arange(n_paydays)[None, :]) * step
+        paydays[rows] = last[rows, None] + steps.astype("timedelta64[D]")
+
+    # Monthly and semi-monthly pay falls on fixed days of each month
+    rows = np.isin(cycle, ["monthly", "semi-monthly"])
+    if rows.any():
+        anchors = np.column_stack([cycles["first_day"].to_numpy()[rows], cycles["second_day"].to_numpy()[rows]])
+        months = today.astype("datetime64[M]") + np.arange(n_paydays + 1)
+        month_starts = months.astype("datetime64[D]")
+        month_lengths = ((months + 1).astype("datetime64[D]") - month_starts).astype(np.int64)
+
+        days = np.minimum(anchors[:, None, :], month_lengths[None, :, None])
+        candidates = month_starts[None, :, None] + (days - 1).astype("timedelta64[D]")
+
+        # Monthly pay only uses its main day, and only dates after today count
+        candidates[cycle[rows] == "monthly", :, 1] = np.datetime64("NaT")
+        candidates = candidates.reshape(rows.sum(), -1)
+        candidates[~(candidates > today)] = np.datetime64("NaT")
+
+        paydays[rows] = np.sort(candidates, axis=1)[:, :n_paydays]
+
+    return paydays
+
+# Function to schedule savings deposits for many users at once
+def schedule_deposits_batch(income, monthly_savings, today, n_deposits=4, delay_days=3):
+    """
+    Schedules savings deposits a few days after each user's upcoming paydays.
+    monthly_savings is indexed by user; each deposit gets the share that keeps the monthly total.
+    Returns one row per deposit with user, date, amount, cycle and confidence.
+    """
+    cycles = detect_pay_cycles(income)
+    paydays = next_paydays(cycles, today, n_deposits)
+
+    cycle = cycles["cycle"].fillna("biweekly")
+    deposits_per_month = 30.44 / cycle.map(PAY_CYCLES)
+    amounts = (monthly_savings.reindex(cycles.index).fillna(0) / deposits_per_month).round(2)
+
+    return pd.DataFrame({
+        "user": np.repeat(cycles.index.to_numpy(), n_deposits),
+        "date": (paydays + np.timedelta64(delay_days, "D")).ravel(),
+        "amount": np.repeat(amounts.to_numpy(), n_deposits),
+        "cycle": np.repeat(cycle.to_numpy(), n_deposits),
+        "confidence": np.repeat(cycles["confidence"].to_numpy(), n_deposits)
+    })
+
 # Function to schedule deposits based on cash flow analysis
 def schedule_deposits():
     """
     Schedules automatic deposits based on cash flow analysis.
-    Returns a schedule of upcoming deposits.
+    Returns a schedule of upcoming deposits aligned to the detected pay cycle.
     """
     # First, get cash flow data
     transactions = connect_bank_account()
     cash_flow = analyze_cash_flow(transactions)
-
-    # Calculate optimal deposit timing and amounts
-    income = cash_flow["income"]
-    expenses = cash_flow["expenses"]
     savings_target = cash_flow["potential_savings"]
 
-    # Default: split savings across 4 weekly deposits
-    weekly_deposit = round(savings_target / 4, 2)
-
-    # Determine paydays (assume bi-weekly income)
-    import datetime
-    today = datetime.date.today()
-
     # Find income transactions to determine pay schedule
-    income_dates = [datetime.datetime.strptime(t["date"], "%Y-%m-%d").date()
-                    for t in transactions if t["amount"] > 0]
+    income_dates = [t["date"] for t in transactions if t["amount"] > 0]
 
     if income_dates:
-        # Sort dates to find the most recent payday
-        income_dates.sort(reverse=True)
-        last_payday = income_dates[0]
-
-        # Calculate next payday (assume biweekly)
-        next_payday = last_payday + datetime.timedelta(days=14)
-
-        # Schedule deposits 3 days after each payday
-        deposit_schedule = []
-        current_date = next_payday + datetime.timedelta(days=3)
-
-        for i in range(4):
-            deposit_schedule.append({
-                "date": current_date.strftime("%Y-%m-%d"),
-                "amount": weekly_deposit
-            })
-            current_date += datetime.timedelta(days=7)
+        income = pd.DataFrame({"user": 0, "date": pd.to_datetime(income_dates)})
+        schedule = schedule_deposits_batch(income, pd.Series({0: savings_target}), datetime.now())
 
-        return deposit_schedule
+        return [
+            {"date": date.strftime("%Y-%m-%d"), "amount": amount}
+            for date, amount in zip(schedule["date"], schedule["amount"])
+        ]
     else:
         # Fallback: schedule weekly deposits starting today
+        weekly_deposit = round(savings_target / 4, 2)
+        today = datetime.now()
         deposit_schedule = []
         for i in range(4):
-            deposit_date = today + datetime.timedelta(days=i*7)
+            deposit_date = today + timedelta(days=i*7)
             deposit_schedule.append({
                 "date": deposit_date.strftime("%Y-%m-%d"),
                 "amount": weekly_deposit
             })
         return deposit_schedule
 
+# Recurring bill and subscription detection
+RECURRING_PERIODS = {"weekly": 7, "biweekly": 14, "monthly": 30.44, "quarterly": 91.31, "yearly": 365.25}
+
+def empty_recurring_series():
+    """Series table before any transaction has been seen"""
+    return pd.DataFrame({
+        "merchant": pd.Series(dtype=str),
+        "type": pd.Series(dtype=str),
+        "amount": pd.Series(dtype=float),
+        "count": pd.Series(dtype=float),
+        "last_date": pd.Series(dtype="datetime64[ns]"),
+        "gap_sum": pd.Series(dtype=float),
+        "gap_sq_sum": pd.Series(dtype=float)
+    })
+
+# Merchant normalization rules: canonical merchant -> keywords found in raw descriptions
+MERCHANT_RULES = {
+    "Payroll": ["payroll", "salary", "direct deposit", "wages"],
+    "Grocery Store": ["grocery", "supermarket", "lidl", "aldi", "tesco", "carrefour", "rewe", "edeka"],
+    "Coffee Shop": ["coffee", "starbucks", "costa", "cafe"],
+    "Streaming Service": ["streaming", "netflix", "spotify", "disney plus", "hbo", "prime video"],
+    "Gas Station": ["gas station", "fuel", "petrol", "shell", "esso", "aral"],
+    "Amazon": ["amazon", "amzn"],
+    "Uber": ["uber"],
+    "Rent": ["rent", "landlord"],
+    "Electricity": ["electricity", "electric", "energy"],
+    "Mobile Phone": ["mobile", "vodafone", "telekom"],
+    "Gym": ["gym", "fitness"]
+}
+
+# Reference numbers, punctuation and payment boilerplate that never identify a merchant
+MERCHANT_NOISE = re.compile(r"[^a-z&' ]+|\b(?:pos|ref|card|txn|transaction|transfer|purchase|payment|sepa|debit|credit)\b")
+
+# Descriptions with nothing left after the noise is removed
+UNKNOWN_MERCHANT = "Unknown"
+
+# Byte table for the character-level part of the noise, applied to a whole column in one pass:
+# ASCII letters are lowercased and punctuation becomes a space; digits are deleted separately
+MERCHANT_NOISE_BYTES = bytes(
+    code + 32 if chr(code).isupper() and code < 128
+    else 32 if code < 128 and not (chr(code).isalnum() or chr(code) in "&' \x00")
+    else code
+    for code in range(256)
+)
+
+def clean_merchant_descriptions(descriptions):
+    """
+    Lowercase a column of descriptions and strip reference numbers and punctuation from it.
+    The column is joined into one byte string so the cleanup is a single C-level translate,
+    which keeps millions of distinct raw strings fast.
+    """
+    texts = descriptions.astype(str)
+    joined = "\x00".join(texts.tolist()).encode("utf-8")
+    cleaned = joined.translate(MERCHANT_NOISE_BYTES, b"0123456789").decode("utf-8").split("\x00")
+
+    # A description with its own NUL byte would split in two; clean those row by row instead
+    if len(cleaned) != len(texts):
+        return [text.lower().translate(str.maketrans("", "", "0123456789")) for text in texts]
+    return cleaned
+
+MERCHANT_CACHE_SIZE = 100000
+
+def compile_merchant_matcher(rules):
+    """Compile every rule keyword into one alternation regex plus a keyword -> merchant lookup"""
+    merchants = {keyword.lower(): merchant for merchant, keywords in rules.items() for keyword in keywords}
+
+    # Longest keywords first so the most specific rule wins
+    keywords = sorted(merchants, key=len, reverse=True)
+    pattern = re.compile(r"\b(?:" + "|".join(re.escape(keyword) for keyword in keywords) + r")\b")
+
+    return pattern, merchants
+
+MERCHANT_MATCHER = compile_merchant_matcher(MERCHANT_RULES)
+
+def normalize_merchant(raw):
+    """Map one raw description to a canonical merchant name"""
+    text = raw.lower()
+
+    pattern, merchants = MERCHANT_MATCHER
+    match = pattern.search(text)
+    if match:
+        return merchants[match.group(0)]
+
+    # No rule matched: drop the noise and keep what is left
+    cleaned = " ".join(MERCHANT_NOISE.sub(" ", text).split())
+    return cleaned.title() if cleaned else UNKNOWN_MERCHANT
+
+def normalize_merchants(descriptions):
+    """
+    Normalize a column of descriptions to merchants.
+    Reference numbers and punctuation are stripped from the whole column first, so raw strings
+    that differ only in them share one cleaned form. Each distinct cleaned string is resolved
+    once and memoized in an LRU kept in session state.
+    """
+    if 'merchant_cache' not in st.session_state:
+        st.session_state.merchant_cache = OrderedDict()
+    cache = st.session_state.merchant_cache
+
+    codes, uniques = pd.factorize(np.array(clean_merchant_descriptions(descriptions), dtype=object))
+
+    merchants = []
+    for text in uniques:
+        merchant = cache.get(text)
+        if merchant is None:
+            merchant = normalize_merchant(text)
+            cache[text] = merchant
+            if len(cache) > MERCHANT_CACHE_SIZE:
+                cache.popitem(last=False)
+        else:
+            cache.move_to_end(text)
+        merchants.append(merchant)
+
+    return pd.Series(np.array(merchants, dtype=object)[codes], index=descriptions.index)
+
+# Transaction auto-categorization
+TRANSACTION_CATEGORIES = ["Income", "Groceries", "Dining", "Entertainment", "Transport", "Shopping", "Utilities", "Other"]
+
+# Bank labels that already name one of our categories
+BANK_CATEGORY_MAP = {
+    "income": "Income", "salary": "Income",
+    "groceries": "Groceries",
+    "dining": "Dining", "restaurants": "Dining",
+    "entertainment": "Entertainment",
+    "transport": "Transport", "transportation": "Transport", "travel": "Transport",
+    "shopping": "Shopping",
+    "utilities": "Utilities", "bills": "Utilities"
+}
+
+# Starting vocabulary for the categorizer, corrections from the user take over from here
+MERCHANT_CATEGORIES = {
+    "Payroll": "Income", "Grocery Store": "Groceries", "Coffee Shop": "Dining",
+    "Streaming Service": "Entertainment", "Gas Station": "Transport", "Amazon": "Shopping",
+    "Uber": "Transport", "Rent": "Other", "Electricity": "Utilities", "Mobile Phone": "Utilities",
+    "Gym": "Entertainment"
+}
+
+CATEGORY_KEYWORDS = {
+    "Income": ["deposit", "refund", "dividend", "interest", "bonus", "transfer in"],
+    "Groceries": ["market", "bakery", "butcher", "food store"],
+    "Dining": ["restaurant", "pizza", "burger", "sushi", "bar", "pub", "takeaway", "lunch", "dinner"],
+    "Entertainment": ["cinema", "movie", "concert", "theatre", "games", "steam", "tickets"],
+    "Transport": ["bus", "train", "metro", "taxi", "parking", "toll", "railway", "airline"],
+    "Shopping": ["store", "shop", "clothing", "fashion", "electronics", "ikea", "zara"],
+    "Utilities": ["water", "internet", "broadband", "gas bill", "insurance", "phone bill"],
+    "Other": ["atm", "cash withdrawal", "fee", "charity", "donation"]
+}
+
+def build_transaction_categorizer(epochs=20):
+    """Build a hashed-feature linear model mapping descriptions to categories, seeded from the keyword rules"""
+    # Hashing keeps the vocabulary open, words never seen before still get a column.
+    # Descriptions are lowercased by pandas beforehand, the vectorizer's own pass is much slower.
+    vectorizer = HashingVectorizer(n_features=2**18, token_pattern=r"[a-z]{2,}", lowercase=False, alternate_sign=False)
+    model = SGDClassifier(loss="log_loss", alpha=1e-5, random_state=42)
+
+    texts, labels = [], []
+    for merchant, keywords in MERCHANT_RULES.items():
+        for text in [merchant] + keywords:
+            texts.append(text)
+            labels.append(MERCHANT_CATEGORIES.get(merchant, "Other"))
+    for category, keywords in CATEGORY_KEYWORDS.items():
+        texts.extend(keywords)
+        labels.extend([category] * len(keywords))
+
+    features = vectorizer.transform([text.lower() for text in texts])
+    labels = np.array(labels)
+    rng = np.random.default_rng(42)
+    for _ in range(epochs):
+        order = rng.permutation(len(labels))
+        model.partial_fit(features[order], labels[order], classes=TRANSACTION_CATEGORIES)
+
+    return {"vectorizer": vectorizer, "model": model, "corrections": 0}
+
+def get_transaction_categorizer():
+    """Return the session categorizer, building it on first use"""
+    if 'categorizer' not in st.session_state:
+        st.session_state.categorizer = build_transaction_categorizer()
+    return st.session_state.categorizer
+
+def categorize_transactions(descriptions, min_confidence=0.5):
+    """
+    Predict a category for every description, each distinct string is scored once.
+    Descriptions the model is unsure about fall back to "Other".
+    """
+    categorizer = get_transaction_categorizer()
+
+    codes, uniques = pd.factorize(descriptions.astype(str).str.lower())
+    if len(uniques) == 0:
+        return pd.Series(pd.Categorical([], categories=TRANSACTION_CATEGORIES), index=descriptions.index)
+
+    model = categorizer["model"]
+    probabilities = model.predict_proba(categorizer["vectorizer"].transform(uniques))
+    predicted = np.where(
+        probabilities.max(axis=1) >= min_confidence,
+        model.classes_[probabilities.argmax(axis=1)],
+        "Other"
+    )
+
+    return pd.Series(pd.Categorical(predicted[codes], categories=TRANSACTION_CATEGORIES), index=descriptions.index)
+
+def learn_transaction_categories(descriptions, categories):
+    """Update the categorizer online from categories the user picked or corrected"""
+    categorizer = get_transaction_categorizer()
+
+    descriptions = pd.Series(descriptions).astype(str)
+    categories = pd.Series(categories).astype(str)
+    known = (descriptions.str.strip() != "") & categories.isin(TRANSACTION_CATEGORIES)
+    if not known.any():
+        return
+
+    features = categorizer["vectorizer"].transform(descriptions[known].str.lower())
+    categorizer["model"].partial_fit(features, categories[known].to_numpy())
+    categorizer["corrections"] += int(known.sum())
+
+def categorize_bank_transactions(transactions):
+    """
+    Relabel bank transactions with our categories.
+    Bank labels we recognise are mapped directly, the rest are predicted from the description.
+    """
+    if not transactions:
+        return transactions
+
+    frame = pd.DataFrame(transactions)
+    labels = frame["category"].fillna("").astype(str).str.strip().str.lower().map(BANK_CATEGORY_MAP)
+
+    known = labels.notna()
+    if (~known).any():
+        labels[~known] = categorize_transactions(frame.loc[~known, "description"]).astype(str)
+
+    return [dict(transaction, category=category) for transaction, category in zip(transactions, labels)]
+
+def update_recurring_series(series, transactions, amount_tolerance=0.1):
+    """
+    Folds a batch of transactions into the per-merchant recurring series.
+    Each series is one merchant, type and amount band, summarised by its count, last date and gap sums.
+    Batches are expected in ledger order; each costs O(b log b) plus the series it touches.
+    """
+    batch = pd.DataFrame({
+        "merchant": normalize_merchants(transactions["description"]).astype(str).to_numpy(),
+        "type": transactions["type"].astype(str).to_numpy(),
+        "date": pd.to_datetime(transactions["date"]).dt.normalize().to_numpy(),
+        "amount": transactions["amount"].astype(float).to_numpy()
+    })
+    batch["log_amount"] = np.log1p(batch["amount"].abs())
+    band = np.log1p(amount_tolerance)
+
+    # Match each row to the existing series of the same merchant with the nearest amount
+    series = series.reset_index(drop=True)
+    references = series[["merchant", "type"]].astype(str).assign(
+        log_amount=np.log1p(series["amount"].abs()),
+        series_id=np.arange(len(series))
+    ).sort_values("log_amount")
+    batch = pd.merge_asof(
+        batch.sort_values("log_amount"), references,
+        on="log_amount", by=["merchant", "type"], direction="nearest", tolerance=band
+    )
+
+    # Unmatched rows form new series, one per merchant, type and amount band
+    new = batch["series_id"].isna()
+    if new.any():
+        fresh = batch[new]
+        new_ids = fresh.groupby(["merchant", "type", np.floor(fresh["log_amount"] / band)], sort=False).ngroup()
+        batch.loc[fresh.index, "series_id"] = len(series) + new_ids
+
+    batch["series_id"] = batch["series_id"].astype(np.int64)
+    batch = batch.sort_values(["series_id", "date"])
+
+    # Gaps chain on from each series' previous last date
+    previous = series["last_date"].reindex(batch["series_id"]).to_numpy()
+    first_in_series = batch["series_id"].ne(batch["series_id"].shift()).to_numpy()
+    prior_dates = np.where(first_in_series, previous, batch["date"].shift().to_numpy())
+    batch["gap"] = (batch["date"].to_numpy() - prior_dates) / np.timedelta64(1, "D")
+    batch["gap_sq"] = batch["gap"] ** 2
+
+    updates = batch.groupby("series_id").agg(
+        merchant=("merchant", "first"),
+        type=("type", "first"),
+        amount_sum=("amount", "sum"),
+        count=("amount", "size"),
+        last_date=("date", "max"),
+        gap_sum=("gap", "sum"),
+        gap_sq_sum=("gap_sq", "sum")
+    )
+
+    # Merge the batch summaries into the series table
+    series = series.reindex(range(max(len(series), int(updates.index.max()) + 1)))
+    old_count = series.loc[updates.index, "count"].fillna(0).to_numpy()
+    old_amount = series.loc[updates.index, "amount"].fillna(0).to_numpy()
+    total_count = old_count + updates["count"].to_numpy()
+
+    series.loc[updates.index, "merchant"] = updates["merchant"]
+    series.loc[updates.index, "type"] = updates["type"]
+    series.loc[updates.index, "amount"] = (old_amount * old_count + updates["amount_sum"].to_numpy()) / total_count
+    series.loc[updates.index, "count"] = total_count
+    series.loc[updates.index, "last_date"] = np.maximum(
+        series.loc[updates.index, "last_date"].fillna(updates["last_date"]).to_numpy(),
+        updates["last_date"].to_numpy()
+    )
+    series.loc[updates.index, "gap_sum"] = series.loc[updates.index, "gap_sum"].fillna(0) + updates["gap_sum"]
+    series.loc[updates.index, "gap_sq_sum"] = series.loc[updates.index, "gap_sq_sum"].fillna(0) + updates["gap_sq_sum"]
+
+    return series
+
+def find_recurring_charges(series, min_occurrences=3, max_gap_spread=0.25, max_missed=2, today=None):
+    """
+    Picks the series that repeat at a steady interval and are still active.
+    A series is retired once max_missed periods pass without a charge, and series without
+    an identifiable merchant are never reported.
+    Returns merchant, type, average amount, period and next expected date for each one.
+    """
+    today = pd.Timestamp(today if today is not None else datetime.now()).normalize()
+    n_gaps = (series["count"] - 1).clip(lower=1)
+    mean_gap = series["gap_sum"] / n_gaps
+    gap_spread = np.sqrt((series["gap_sq_sum"] / n_gaps - mean_gap ** 2).clip(lower=0))
+    active = series["last_date"] + pd.to_timedelta(mean_gap * max_missed, unit="D") >= today
+
+    recurring = (series["count"] >= min_occurrences) & \
+                (mean_gap >= 5) & \
+                (gap_spread <= mean_gap * max_gap_spread) & \
+                active & \
+                (series["merchant"] != UNKNOWN_MERCHANT)
+    charges = series[recurring].assign(period_days=mean_gap[recurring])
+
+    # Name the period after the nearest common billing cycle
+    lengths = np.array(list(RECURRING_PERIODS.values()))
+    nearest = np.abs(np.log(charges["period_days"].to_numpy()[:, None] / lengths[None, :])).argmin(axis=1)
+    charges["period"] = np.array(list(RECURRING_PERIODS))[nearest]
+    charges["next_date"] = charges["last_date"] + pd.to_timedelta(charges["period_days"].round(), unit="D")
+
+    charges["count"] = charges["count"].astype(int)
+
+    return charges[["merchant", "type", "amount", "period", "period_days", "next_date", "count"]].reset_index(drop=True)
+
+def fold_recurring_batch(series, batch, transaction_data):
+    """
+    Fold appended rows into the series table. Rows dated before their merchant's last charge
+    would chain a negative gap, so those merchants are rebuilt from the full ledger instead.
+    """
+    if series.empty:
+        return update_recurring_series(series, batch)
+
+    merchants = normalize_merchants(batch["description"]).astype(str)
+    dates = pd.to_datetime(batch["date"]).dt.normalize()
+    last_dates = series.groupby("merchant")["last_date"].max()
+    backdated = (dates < merchants.map(last_dates)).fillna(False).to_numpy(dtype=bool)
+
+    stale = set(merchants[backdated])
+    if not stale:
+        return update_recurring_series(series, batch)
+
+    ledger_merchants = normalize_merchants(transaction_data["description"]).astype(str)
+    series = update_recurring_series(series[~series["merchant"].isin(stale)], transaction_data[ledger_merchants.isin(stale).to_numpy()])
+
+    rest = batch[~merchants.isin(stale).to_numpy()]
+    return update_recurring_series(series, rest) if len(rest) else series
+
+def get_recurring_charges(transaction_data):
+    """
+    Returns recurring income and bills for the session ledger, cached per ledger version.
+    Appended rows are folded in incrementally; anything else (a shorter ledger or a changed
+    last-seen row) rebuilds the series from scratch.
+    """
+    version = get_ledger_version(transaction_data)
+    state = st.session_state.get("recurring_state")
+    if state is not None and state["version"] == version:
+        return find_recurring_charges(state["series"])
+
+    appended = state is not None and len(transaction_data) >= state["rows_seen"] and (
+        state["rows_seen"] == 0 or
+        transaction_data.iloc[state["rows_seen"] - 1][["date", "description", "amount"]].tolist() == state["last_row"]
+    )
+    if not appended:
+        state = {"rows_seen": 0, "series": empty_recurring_series()}
+
+    if len(transaction_data) > state["rows_seen"]:
+        state["series"] = fold_recurring_batch(state["series"], transaction_data.iloc[state["rows_seen"]:], transaction_data)
+
+    state["rows_seen"] = len(transaction_data)
+    state["last_row"] = transaction_data.iloc[-1][["date", "description", "amount"]].tolist() if len(transaction_data) else None
+    state["version"] = version
+    st.session_state.recurring_state = state
+
+    return find_recurring_charges(state["series"])
+
+# Streaming anomaly detection on spending
+ANOMALY_ALPHA = 0.05      # EWMA weight of the newest transaction
+ANOMALY_Z = 3.0           # Standard deviations above the category norm to raise an alert
+ANOMALY_WARMUP = 5        # Transactions a category needs before it can raise alerts
+ANOMALY_MIN_STD = 0.1     # Floor on the log-amount spread, fixed-price bills would otherwise never vary
+MAX_SPENDING_ALERTS = 50
+
+def update_anomaly_detector(state, transactions, alpha=ANOMALY_ALPHA, z_threshold=ANOMALY_Z, warmup=ANOMALY_WARMUP):
+    """
+    Score expenses against a per-category EWMA of their log amount, then fold them into it.
+    state maps category -> (mean, mean of squares, count) and is updated in place, so each
+    transaction costs O(1) whether it arrives alone or in a batch.
+    Returns the expenses with their z_score and an anomaly flag.
+    """
+    expenses = transactions[transactions["type"] == "expense"]
+    log_amounts = np.log1p(expenses["amount"].abs().to_numpy(dtype=float))
+    z_scores = np.zeros(len(expenses))
+
+    for category, positions in expenses.groupby("category", observed=True).indices.items():
+        x = log_amounts[positions]
+        mean, mean_sq, count = state.get(category, (x[0], x[0] ** 2, 0))
+
+        # Both moments are first-order IIR filters, lfilter runs the recursion seeded with the stored state
+        means, _ = lfilter([alpha], [1, alpha - 1], x, zi=[(1 - alpha) * mean])
+        means_sq, _ = lfilter([alpha], [1, alpha - 1], x ** 2, zi=[(1 - alpha) * mean_sq])
+
+        # Each transaction is judged against the state before it arrived
+        prior_mean = np.concatenate([[mean], means[:-1]])
+        prior_sq = np.concatenate([[mean_sq], means_sq[:-1]])
+        prior_std = np.sqrt(np.clip(prior_sq - prior_mean ** 2, ANOMALY_MIN_STD ** 2, None))
+        prior_count = count + np.arange(len(x))
+
+        z_scores[positions] = np.where(prior_count >= warmup, (x - prior_mean) / prior_std, 0.0)
+        state[category] = (means[-1], means_sq[-1], count + len(x))
+
+    return expenses.assign(z_score=z_scores, anomaly=z_scores > z_threshold)
+
+def get_spending_alerts(transaction_data):
+    """
+    Returns the most recent unusually large expenses in the session ledger.
+    The ledger is append-only, so each call only scores rows added since the last one.
+    """
+    detector = st.session_state.get("anomaly_detector")
+    if detector is None or len(transaction_data) < detector["rows_seen"]:
+        detector = {"rows_seen": 0, "state": {}, "alerts": transaction_data.iloc[:0].assign(z_score=0.0)}
+
+    if len(transaction_data) > detector["rows_seen"]:
+        scored = update_anomaly_detector(detector["state"], transaction_data.iloc[detector["rows_seen"]:])
+        flagged = scored[scored["anomaly"]].drop(columns="anomaly")
+        if not flagged.empty:
+            detector["alerts"] = pd.concat([detector["alerts"], flagged]).tail(MAX_SPENDING_ALERTS)
+        detector["rows_seen"] = len(transaction_data)
+        st.session_state.anomaly_detector = detector
+
+    return detector["alerts"]
+
+# Monthly budget envelopes: running totals per category, updated as transactions are added
+def new_budget_envelopes(month, start=None):
+    """Empty envelope state for a month; spending before start is not budgeted"""
+    return {"rows_seen": 0, "start": start if start is not None else month, "month": month, "spent": {}, "carry": {}, "upcoming": {}}
+
+def update_budget_envelopes(envelopes, transactions):
+    """
+    Add a batch of transactions to the envelope totals. Expenses in the current month count
+    against it, back-dated ones come out of the carried-over balance, and future-dated ones
+    wait in upcoming until their month is reached.
+    """
+    expenses = transactions[transactions["type"] == "expense"]
+    if expenses.empty:
+        return envelopes
+
+    months = pd.to_datetime(expenses["date"]).dt.to_period("M")
+    batch = expenses["amount"].abs().groupby([months, expenses["category"]]).sum()
+
+    for (month, category), amount in batch.items():
+        if month == envelopes["month"]:
+            envelopes["spent"][category] = envelopes["spent"].get(category, 0.0) + amount
+        elif envelopes["start"] <= month < envelopes["month"] and category in st.session_state.budget_limits:
+            envelopes["carry"][category] = envelopes["carry"].get(category, 0.0) - amount
+        elif month > envelopes["month"]:
+            upcoming = envelopes["upcoming"].setdefault(month, {})
+            upcoming[category] = upcoming.get(category, 0.0) + amount
+
+    return envelopes
+
+def roll_budget_envelopes(envelopes, month):
+    """Close each month up to the given one, carrying what was left in every budgeted envelope into the next"""
+    limits = st.session_state.budget_limits
+    while envelopes["month"] < month:
+        for category, limit in limits.items():
+            left = limit - envelopes["spent"].get(category, 0.0)
+            envelopes["carry"][category] = envelopes["carry"].get(category, 0.0) + left
+        envelopes["month"] += 1
+        envelopes["spent"] = envelopes["upcoming"].pop(envelopes["month"], {})
+
+    return envelopes
+
+def get_budget_envelopes(transaction_data):
+    """
+    Returns the session's envelope state, brought up to date with rows added since the last call.
+    The ledger is append-only, so a shorter ledger means it was reset and the totals are replayed.
+    """
+    current_month = pd.Timestamp(datetime.now()).to_period("M")
+    envelopes = st.session_state.get("budget_envelopes")
+    if envelopes is None or len(transaction_data) < envelopes["rows_seen"]:
+        start = envelopes["start"] if envelopes is not None else current_month
+        envelopes = new_budget_envelopes(start)
+
+    if len(transaction_data) > envelopes["rows_seen"]:
+        update_budget_envelopes(envelopes, transaction_data.iloc[envelopes["rows_seen"]:])
+        envelopes["rows_seen"] = len(transaction_data)
+
+    roll_budget_envelopes(envelopes, current_month)
+    st.session_state.budget_envelopes = envelopes
+
+    return envelopes
+
+def set_budget_limit(category, limit):
+    """Set a category's monthly envelope, effective from the current month"""
+    if limit > 0:
+        st.session_state.budget_limits[category] = float(limit)
+    else:
+        st.session_state.budget_limits.pop(category, None)
+
+def envelope_status(envelopes, category):
+    """This month's limit, carried-over balance, spending and what is left for one category"""
+    limit = st.session_state.budget_limits.get(category, 0.0)
+    carry = envelopes["carry"].get(category, 0.0)
+    spent = envelopes["spent"].get(category, 0.0)
+    available = limit + carry
+
+    return {
+        "category": category,
+        "limit": limit,
+        "carry": carry,
+        "spent": spent,
+        "available": available,
+        "remaining": available - spent,
+        "overspent": spent > available
+    }
+
+def budget_overview(envelopes):
+    """Envelope status for every budgeted category, most overspent first"""
+    statuses = [envelope_status(envelopes, category) for category in st.session_state.budget_limits]
+    return sorted(statuses, key=lambda status: status["remaining"])
+
+# Function to project daily balances for many users at once
+def project_balances_batch(start_balances, flows, daily_spend, start_date, horizon=90, threshold=0.0):
+    """
+    Projects day-level balances for a batch of users in one vectorized pass.
+    start_balances and daily_spend are indexed by user; flows has one row per recurring
+    flow with user, amount, period_days and next_date.
+    Returns the balance curves (users x days) and each user's first projected overdraft date.
+    """
+    users = start_balances.index
+    start_date = pd.Timestamp(start_date).normalize()
+    flows = flows[users.get_indexer(flows["user"]) >= 0]
+
+    user_codes = users.get_indexer(flows["user"])
+    amounts = flows["amount"].to_numpy(dtype=float)
+    periods = flows["period_days"].to_numpy(dtype=float)
+    first_offsets = (flows["next_date"] - start_date).dt.days.to_numpy(dtype=float)
+
+    # Overdue flows roll forward to their next occurrence from the start date
+    missed = np.ceil(np.clip(-first_offsets, 0, None) / periods)
+    first_offsets = first_offsets + missed * periods
+
+    # Expand every flow into its occurrences inside the horizon
+    max_occurrences = int(np.ceil(horizon / periods.min())) if len(flows) else 0
+    offsets = np.rint(first_offsets[:, None] + np.arange(max_occurrences)[None, :] * periods[:, None]).astype(np.int64)
+    inside = (offsets >= 0) & (offsets < horizon)
+
+    cells = (user_codes[:, None] * horizon + offsets)[inside]
+    weights = np.broadcast_to(amounts[:, None], offsets.shape)[inside]
+    # Without any flows bincount returns integers, so force float for the spend below
+    daily = np.bincount(cells, weights=weights, minlength=len(users) * horizon).astype(float).reshape(len(users), horizon)
+
+    # Discretionary spend drains the balance every day
+    daily -= daily_spend.reindex(users).fillna(0).to_numpy(dtype=float)[:, None]
+    balances = start_balances.to_numpy(dtype=float)[:, None] + np.cumsum(daily, axis=1)
+
+    overdrawn = balances < threshold
+    first_day = pd.to_timedelta(overdrawn.argmax(axis=1), unit="D")
+    overdraft_dates = pd.Series(start_date + first_day, index=users).where(overdrawn.any(axis=1))
+
+    return {
+        "dates": pd.date_range(start_date, periods=horizon, freq="D"),
+        "balances": balances,
+        "overdraft_dates": overdraft_dates,
+        "lowest_balances": pd.Series(balances.min(axis=1), index=users)
+    }
+
+# Balance history from end-of-day checkpoints
+def build_balance_checkpoints(transaction_data):
+    """Net ledger movement up to the end of each day with activity, in date order"""
+    features = get_transaction_features(transaction_data)
+    daily = features['amount'].groupby(features['date'].dt.normalize()).sum()
+
+    return {'dates': daily.index.to_numpy(), 'cumulative': daily.cumsum().to_numpy()}
+
+def extend_balance_checkpoints(checkpoints, new_transactions):
+    """
+    Append checkpoints for transactions dated on or after the last checkpoint.
+    Returns None for back-dated transactions, which shift every later checkpoint and need a rebuild.
+    """
+    added = build_balance_checkpoints(new_transactions)
+    if len(checkpoints['dates']) == 0:
+        return added
+    if len(added['dates']) == 0:
+        return checkpoints
+    if added['dates'][0] < checkpoints['dates'][-1]:
+        return None
+
+    dates, cumulative = checkpoints['dates'], checkpoints['cumulative']
+    added_cumulative = added['cumulative'] + cumulative[-1]
+
+    # Same-day activity folds into the last checkpoint instead of adding a new one
+    if added['dates'][0] == dates[-1]:
+        dates, cumulative = dates[:-1], cumulative[:-1]
+
+    return {'dates': np.concatenate([dates, added['dates']]), 'cumulative': np.concatenate([cumulative, added_cumulative])}
+
+def get_balance_checkpoints(transaction_data):
+    """
+    Return the balance checkpoints of the session ledger.
+    Rows appended since the last call are folded in, the full rebuild only runs for back-dated entries.
+    """
+    cache = st.session_state.get('balance_checkpoints')
+    if cache is None or len(transaction_data) < cache['rows_seen']:
+        cache = {'rows_seen': len(transaction_data), 'checkpoints': build_balance_checkpoints(transaction_data)}
+    elif len(transaction_data) > cache['rows_seen']:
+        checkpoints = extend_balance_checkpoints(cache['checkpoints'], transaction_data.iloc[cache['rows_seen']:])
+        if checkpoints is None:
+            checkpoints = build_balance_checkpoints(transaction_data)
+        cache = {'rows_seen': len(transaction_data), 'checkpoints': checkpoints}
+    st.session_state.balance_checkpoints = cache
+
+    return cache['checkpoints']
+
+def balance_at(checkpoints, current_balance, when):
+    """
+    Balance at the end of a given day, found by binary search over the checkpoints.
+    The current balance already includes every transaction, so the opening balance is what remains once they are backed out.
+    """
+    cumulative = checkpoints['cumulative']
+    opening = current_balance - (cumulative[-1] if len(cumulative) else 0.0)
+
+    position = np.searchsorted(checkpoints['dates'], np.datetime64(pd.Timestamp(when).normalize()), side='right')
+    return opening + (cumulative[position - 1] if position > 0 else 0.0)
+
+def balance_history(checkpoints, current_balance, start=None, end=None):
+    """End-of-day balance for every day from start to end, in one vectorized lookup"""
+    dates, cumulative = checkpoints['dates'], checkpoints['cumulative']
+    opening = current_balance - (cumulative[-1] if len(cumulative) else 0.0)
+
+    start = pd.Timestamp(start if start is not None else (dates[0] if len(dates) else datetime.now())).normalize()
+    end = pd.Timestamp(end if end is not None else datetime.now()).normalize()
+    days = pd.date_range(start, end, freq='D')
+
+    positions = np.searchsorted(dates, days.to_numpy(), side='right')
+    balances = opening + np.where(positions > 0, cumulative[np.maximum(positions - 1, 0)] if len(cumulative) else 0.0, 0.0)
+
+    return pd.Series(balances, index=days, name='balance')
+
+# Function to project the user's daily balance and warn about overdrafts
+def project_cash_flow(transaction_data, balance, horizon=90):
+    """
+    Combines recurring income and bills with forecast discretionary spend.
+    Returns the projected daily balance curve and the first overdraft date, if any.
+    """
+    flows = get_recurring_charges(transaction_data).assign(user=0)
+
+    # Discretionary spend is the forecast monthly total less the recurring bills
+    bills = flows[flows["type"] == "expense"]
+    monthly_bills = (-bills["amount"] * 30.44 / bills["period_days"]).sum()
+
+    forecast_total = 0.0
+    model = get_expense_forecaster(transaction_data)
+    if model is not None:
+        forecast = evaluate_expense_forecast(model, horizon=1)
+        forecast_total = forecast.loc[forecast["category"] == "Total", "forecast"].iloc[0]
+
+    daily_spend = max(forecast_total - monthly_bills, 0) / 30.44
+
+    return project_balances_batch(
+        pd.Series([balance]), flows, pd.Series([daily_spend]), datetime.now(), horizon
+    )
+
 
  # Function to micro-invest accumulated savings
 def micro_invest(savings):
@@ -507,33 +1475,96 @@ def micro_invest(savings):
          "allocation": allocation
      }
 
+# Goal allocation: fund as many goals on time as the monthly savings allow
+def solve_goal_allocation(remaining, months_left, budget):
+    """
+    Split monthly savings across goals so that as many as possible finish by their deadline.
+    Takes (users x goals) arrays of remaining amounts and months to deadline, NaN-padded where
+    a user has fewer goals, and one monthly budget per user; a single user's 1-D arrays work too.
+    Returns the monthly allocation and which goals it puts on time, in the shape of remaining.
+    """
+    remaining = np.asarray(remaining, dtype=float)
+    squeeze = remaining.ndim == 1
+    remaining = np.atleast_2d(remaining)
+    months_left = np.atleast_2d(np.asarray(months_left, dtype=float))
+    budget = np.atleast_1d(np.asarray(budget, dtype=float)).clip(min=0)
+    n_users, n_goals = remaining.shape
+    users = np.arange(n_users)
+
+    # Each open goal is on time at a fixed monthly rate; overdue goals need what is left this month
+    open_goal = np.isfinite(remaining) & (remaining > 0)
+    required = np.where(open_goal, remaining / np.maximum(np.nan_to_num(months_left, nan=1.0), 1.0), np.inf)
+
+    # Every on-time goal counts the same, so the cheapest rates first fund the most of them
+    order = np.argsort(required, axis=1, kind="stable")
+    sorted_required = np.take_along_axis(required, order, axis=1)
+    funded = np.cumsum(sorted_required, axis=1) <= budget[:, None]
+    sorted_allocation = np.where(funded, sorted_required, 0.0)
+    leftover = budget - sorted_allocation.sum(axis=1)
+
+    # What is left goes to the cheapest goal that could not be fully funded
+    n_funded = funded.sum(axis=1)
+    partial = n_funded < open_goal.sum(axis=1)
+    sorted_allocation[users[partial], n_funded[partial]] = leftover[partial]
+    leftover[partial] = 0.0
+
+    allocation = np.zeros_like(sorted_allocation)
+    np.put_along_axis(allocation, order, sorted_allocation, axis=1)
+
+    # With every goal on time, the surplus brings them forward in proportion to what each still needs
+    headroom = np.where(open_goal, remaining - allocation, 0.0)
+    total_headroom = headroom.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        surplus_share = np.where(total_headroom[:, None] > 0, headroom / total_headroom[:, None], 0.0)
+    allocation += np.minimum(leftover, total_headroom)[:, None] * surplus_share
+
+    on_time = open_goal & (allocation >= required * (1 - 1e-9))
+    allocation = np.where(np.isnan(remaining), np.nan, allocation)
+
+    if squeeze:
+        return allocation[0], on_time[0]
+    return allocation, on_time
+
+def goal_allocation_inputs(goals, today=None):
+    """Remaining amounts and months to deadline of a goal store or list, for solve_goal_allocation"""
+    today = pd.Timestamp(today if today is not None else datetime.now()).normalize()
+    goals = list(goals.values()) if isinstance(goals, dict) else list(goals)
+
+    remaining = np.array([max(goal["target"] - goal["current"], 0.0) for goal in goals], dtype=float)
+    target_dates = pd.to_datetime([goal["date"] for goal in goals])
+    months_left = (target_dates - today).days.to_numpy() / DAYS_PER_MONTH
+
+    return remaining, months_left
+
  # Function to allocate funds based on user preferences
 def allocate_funds():
      """
      Allocates funds based on user goals and risk profile.
      Returns personalized fund allocation.
      """
-     # In a real app, we would retrieve user preferences from a database
-     user_preferences = {
-         "risk_tolerance": "moderate",  # Options: conservative, moderate, aggressive
-         "goals": [
-             {"name": "Emergency Fund", "priority": "high", "target": 10000},
-             {"name": "Retirement", "priority": "medium", "target": 50000},
-             {"name": "Vacation", "priority": "low", "target": 2000}
-         ]
-     }
-
-     # Get current savings
-     transactions = connect_bank_account()
-     cash_flow = analyze_cash_flow(transactions)
-     monthly_savings = cash_flow["potential_savings"]
+     # Monthly savings from the last 90 days of the ledger, or the linked bank account without one
+     kpis = window_kpis(get_window_index(st.session_state.transactions), 90)
+     if kpis['covered_days']:
+         monthly_savings = round(max(kpis['monthly_income'] - kpis['monthly_expenses'], 0.0), 2)
+     else:
+         transactions = connect_bank_account()
+         cash_flow = analyze_cash_flow(transactions)
+         monthly_savings = cash_flow["potential_savings"]
 
-     # Allocate based on priority
+     # Allocate across the user's goals to finish as many as possible on time, keyed by goal id
+     # since names need not be unique
      allocation = {}
-     priority_weights = {"high": 0.6, "medium": 0.3, "low": 0.1}
-
-     for goal in user_preferences["goals"]:
-         allocation[goal["name"]] = round(monthly_savings * priority_weights[goal["priority"]], 2)
+     on_time_goals = []
+     goal_ids = list(st.session_state.goals)
+     goals = list(st.session_state.goals.values())
+     if goals:
+         remaining, months_left = goal_allocation_inputs(goals)
+         amounts, on_time = solve_goal_allocation(remaining, months_left, monthly_savings)
+
+         for goal_id, amount, goal_on_time in zip(goal_ids, amounts, on_time):
+             allocation[goal_id] = round(float(amount), 2)
+             if goal_on_time:
+                 on_time_goals.append(goal_id)
 
      # Adjust investment strategy based on risk tolerance
      investment_strategies = {
@@ -554,10 +1585,12 @@ def allocate_funds():
          }
      }
 
-     risk_profile = investment_strategies[user_preferences["risk_tolerance"]]
+     risk_profile = investment_strategies[st.session_state.get('risk_profile', 'Moderate').lower()]
 
      return {
          "monthly_allocation": allocation,
+         "on_time_goals": on_time_goals,
+         "goal_names": {goal_id: goal["name"] for goal_id, goal in zip(goal_ids, goals)},
          "investment_strategy": risk_profile,
          "total_monthly_savings": monthly_savings
      }
@@ -602,11 +1635,13 @@ def generate_personalized_insights():
              "description": f"Your highest expense category is {highest_category[0]} at ${highest_category[1]:.2f}."
          })
 
-         # Look for unusual spending patterns
-         avg_transaction = sum(abs(t["amount"]) for t in transactions if t["amount"] < 0) / len([t for t in transactions if t["amount"] < 0])
-         large_transactions = [t for t in transactions if t["amount"] < 0 and abs(t["amount"]) > avg_transaction * 2]
+         # Look for unusual spending patterns, in date order as they would have streamed in
+         history = pd.DataFrame(transactions).sort_values("date")
+         history["type"] = np.where(history["amount"] < 0, "expense", "income")
+         scored = update_anomaly_detector({}, history)
+         large_transactions = scored[scored["anomaly"]]
 
-         if large_transactions:
+         if not large_transactions.empty:
              insights.append({
                  "type": "alert",
                  "title": "Large Recent Transactions",
@@ -615,11 +1650,12 @@ def generate_personalized_insights():
 
      # Add investment recommendations
      allocation = allocate_funds()
-     if "Retirement" in allocation["monthly_allocation"]:
+     late_goals = [allocation["goal_names"][goal_id] for goal_id in allocation["monthly_allocation"] if goal_id not in allocation["on_time_goals"]]
+     if late_goals:
          insights.append({
              "type": "recommendation",
-             "title": "Retirement Savings",
-             "description": f"Consider increasing your retirement contributions by setting aside ${allocation['monthly_allocation']['Retirement']:.2f} monthly."
+             "title": "Goals Behind Schedule",
+             "description": f"Your monthly savings of ${allocation['total_monthly_savings']:.2f} can't keep {', '.join(late_goals)} on schedule. Consider saving more or moving their target dates."
          })
 
      return insights
@@ -651,7 +1687,7 @@ def generate_insights():
 
      # Add insights based on goals
      if st.session_state.goals:
-         for goal in st.session_state.goals:
+         for goal in st.session_state.goals.values():
              progress = (goal["current"] / goal["target"]) * 100
              insights.append(f"Your {goal['name']} goal is {progress:.1f}% complete.")
 
@@ -669,32 +1705,380 @@ def generate_insights():
 
      return insights[:3]  # Return at most 3 insights
 
- # Function to predict future expenses using a simple linear regression model
-def predict_future_expenses():
-     if not st.session_state.transactions.empty:
-         # Prepare data for prediction
-         transactions_df = st.session_state.transactions.copy()
-         transactions_df['date'] = pd.to_datetime(transactions_df['date'])
-         transactions_df['month'] = transactions_df['date'].dt.to_period('M').astype(str)
+ # Seasonal per-category expense forecaster
+def build_forecast_design(first_month, month_index, seasonal):
+     """Design matrix with intercept, linear trend and optional month-of-year dummies"""
+     columns = [np.ones(len(month_index)), month_index.astype(float)]
+
+     if seasonal:
+         month_of_year = (first_month + month_index) % 12
+         columns += [(month_of_year == m).astype(float) for m in range(1, 12)]
+
+     return np.column_stack(columns)
+
+def fit_expense_forecaster(transaction_data):
+     """Fit trend plus monthly seasonality for all expense categories in one least-squares solve"""
+     features = get_transaction_features(transaction_data)
+     expenses = features[features['type'] == 'expense']
+     if expenses.empty:
+         return None
+
+     month_key = expenses['year'].to_numpy(dtype=np.int32) * 12 + expenses['month'].to_numpy(dtype=np.int32) - 1
+     amounts = expenses['amount_abs'].to_numpy()
+     category_codes, categories = pd.factorize(expenses['category'])
+
+     # The month in progress would be fitted as a short month, so only complete months are used;
+     # with nothing else to go on, it is scaled up to a full month by the days elapsed so far
+     today = pd.Timestamp(datetime.now())
+     current_month = today.year * 12 + today.month - 1
+     complete = month_key < current_month
+     if complete.any():
+         month_key, amounts, category_codes = month_key[complete], amounts[complete], category_codes[complete]
+     else:
+         amounts = amounts * today.days_in_month / today.day
+
+     # Month x category spend matrix over a contiguous range of months
+     first_month = int(month_key.min())
+     n_months = int(month_key.max()) - first_month + 1
+     cells = (month_key - first_month) * len(categories) + category_codes
+
+     spend = np.bincount(cells, weights=amounts, minlength=n_months * len(categories))
+     spend = spend.reshape(n_months, len(categories))
+
+     # The total is fitted as one more column so it gets its own interval
+     spend = np.column_stack([spend, spend.sum(axis=1)])
+
+     # Seasonality needs two full years, shorter histories get trend only
+     seasonal = n_months >= 24
+     design = build_forecast_design(first_month, np.arange(n_months), seasonal)
+     coefficients = np.linalg.lstsq(design, spend, rcond=None)[0]
+
+     residuals = spend - design @ coefficients
+     dof = max(n_months - design.shape[1], 1)
+
+     return {
+         'first_month': first_month,
+         'n_months': n_months,
+         'seasonal': seasonal,
+         'categories': [str(c) for c in categories] + ['Total'],
+         'coefficients': coefficients,
+         'sigma': np.sqrt((residuals ** 2).sum(axis=0) / dof),
+         'xtx_inv': np.linalg.pinv(design.T @ design)
+     }
 
-         # Group by month and sum expenses
-         monthly_expenses = transactions_df[transactions_df['type'] == 'expense'].groupby('month')['amount'].sum().reset_index()
-         monthly_expenses['amount'] = monthly_expenses['amount'].abs()  # Make sure amounts are positive
+def get_expense_forecaster(transaction_data):
+     """Return the fitted forecaster, refitted only when the ledger version or the current month changes"""
+     version = (get_ledger_version(transaction_data), datetime.now().strftime("%Y-%m"))
 
-         # Create a numerical month index for regression
-         monthly_expenses['month_index'] = np.arange(len(monthly_expenses))
+     cache = st.session_state.get('expense_forecaster')
+     if cache is None or cache['version'] != version:
+         cache = {'version': version, 'model': fit_expense_forecaster(transaction_data)}
+         st.session_state.expense_forecaster = cache
 
-         # Train a linear regression model
-         model = LinearRegression()
-         model.fit(monthly_expenses[['month_index']], monthly_expenses['amount'])
+     return cache['model']
 
-         # Predict next 3 months
-         future_months = np.array([[len(monthly_expenses) + i] for i in range(1, 4)])
-         predictions = model.predict(future_months)
+def evaluate_expense_forecast(model, horizon=3, z=1.96):
+     """Evaluate cached coefficients for the next months, with prediction intervals"""
+     month_index = np.arange(model['n_months'], model['n_months'] + horizon)
+     design = build_forecast_design(model['first_month'], month_index, model['seasonal'])
 
-         return predictions
+     forecast = np.clip(design @ model['coefficients'], 0, None)
+
+     # Interval widens with the distance from the fitted months
+     leverage = np.einsum('ij,jk,ik->i', design, model['xtx_inv'], design)
+     margin = z * np.sqrt(1 + leverage)[:, None] * model['sigma'][None, :]
+
+     month_keys = model['first_month'] + month_index
+     months = [f"{key // 12}-{key % 12 + 1:02d}" for key in month_keys]
+
+     return pd.DataFrame({
+         'month': np.repeat(months, len(model['categories'])),
+         'category': np.tile(model['categories'], horizon),
+         'forecast': forecast.ravel(),
+         'lower': np.clip(forecast - margin, 0, None).ravel(),
+         'upper': (forecast + margin).ravel()
+     })
+
+ # Function to predict future expenses per category with the seasonal forecaster
+def predict_future_expenses(horizon=3):
+     if not st.session_state.transactions.empty:
+         model = get_expense_forecaster(st.session_state.transactions)
+         if model is not None:
+             return evaluate_expense_forecast(model, horizon)
      return None
 
+# Goal forecasting from contribution history
+GOAL_SIMULATIONS = 2000
+
+def record_goal_contribution(goal, amount, when=None):
+    """Log a change in a goal's saved amount, the history behind its forecast, appending it to the goal's log on disk"""
+    entry = {"date": pd.Timestamp(when if when is not None else datetime.now()).strftime("%Y-%m-%d"), "amount": float(amount)}
+    goal.setdefault("contributions", []).append(entry)
+
+    store_dir = get_goal_store_dir()
+    if "id" in goal and store_dir is not None:
+        with open_private(os.path.join(store_dir, f"{goal['id']}.jsonl"), "a") as log_file:
+            log_file.write(json.dumps(entry) + "\n")
+
+# App data: user accounts and everything saved per user, kept out of the temp folder so it survives restarts
+APP_DATA_DIR = os.environ.get("NEURO_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "neuro_data"))
+USER_REGISTRY_PATH = os.path.join(APP_DATA_DIR, "users.json")
+PASSWORD_HASH_ITERATIONS = 200000
+
+def make_private_dir(path):
+    """Create a directory readable only by the app's own user"""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    os.chmod(path, 0o700)
+    return path
+
+def open_private(path, mode="w"):
+    """Open a file for writing that only the app's own user can read"""
+    make_private_dir(os.path.dirname(path))
+    descriptor = os.open(path, os.O_WRONLY | os.O_CREAT | (os.O_APPEND if "a" in mode else os.O_TRUNC), 0o600)
+    return os.fdopen(descriptor, mode, encoding="utf-8")
+
+def hash_password(password, salt):
+    """Salted PBKDF2 hash of a password"""
+    return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), bytes.fromhex(salt), PASSWORD_HASH_ITERATIONS).hex()
+
+def load_user_registry():
+    """Registered accounts: username -> user id, salt and password hash"""
+    if not os.path.exists(USER_REGISTRY_PATH):
+        return {}
+    with open(USER_REGISTRY_PATH, encoding="utf-8") as registry_file:
+        return json.load(registry_file)
+
+def register_user(username, password):
+    """Create an account and return its user id, or None when the username is taken"""
+    registry = load_user_registry()
+    if username in registry:
+        return None
+
+    salt = os.urandom(16).hex()
+    registry[username] = {"user_id": uuid.uuid4().hex, "salt": salt, "password_hash": hash_password(password, salt)}
+    with open_private(USER_REGISTRY_PATH) as registry_file:
+        json.dump(registry, registry_file)
+
+    return registry[username]["user_id"]
+
+def authenticate_user(username, password):
+    """Return the user id for a correct username and password, otherwise None"""
+    account = load_user_registry().get(username)
+    if account is None or not hmac.compare_digest(account["password_hash"], hash_password(password, account["salt"])):
+        return None
+    return account["user_id"]
+
+def delete_user(username):
+    """Remove an account from the registry"""
+    registry = load_user_registry()
+    if registry.pop(username, None) is not None:
+        with open_private(USER_REGISTRY_PATH) as registry_file:
+            json.dump(registry, registry_file)
+
+def start_user_session(user_id, username):
+    """Bind the session to an authenticated user and restore the goals they saved earlier"""
+    st.session_state.user_id = user_id
+    st.session_state.username = username
+    st.session_state.goals = {}
+    st.session_state.goal_metrics = {'count': 0, 'progress_sum': 0.0}
+    load_goal_store()
+
+    # Chat from before login is not carried into the user's archive
+    for key in ('ai_messages', 'chat_archive', 'chat_archive_shown'):
+        st.session_state.pop(key, None)
+
+# Goal store: goals keyed by a stable id, with goal-derived metrics kept up to date on every change
+GOAL_STORE_ROOT = os.path.join(APP_DATA_DIR, "goals")
+
+def get_goal_store_dir():
+    """Directory holding the logged-in user's goal index and contribution logs, None before login"""
+    user_id = st.session_state.get('user_id')
+    if not user_id:
+        return None
+    return os.path.join(GOAL_STORE_ROOT, user_id)
+
+def goal_progress(goal):
+    """Percentage of a goal's target saved so far"""
+    return goal["current"] / goal["target"] * 100
+
+def track_goal_metrics(goal, sign):
+    """Add (sign=1) or remove (sign=-1) a goal's contribution to the running goal metrics"""
+    metrics = st.session_state.goal_metrics
+    metrics['count'] += sign
+    metrics['progress_sum'] += sign * goal_progress(goal)
+
+def average_goal_progress(goals=None):
+    """Average goal progress in percent, an O(1) read of the running metrics for the session's goal store"""
+    if goals is None or goals is st.session_state.get('goals'):
+        metrics = st.session_state.goal_metrics
+        return metrics['progress_sum'] / metrics['count'] if metrics['count'] else 0
+
+    goals = list(goals.values()) if isinstance(goals, dict) else goals
+    return sum(goal_progress(goal) for goal in goals) / len(goals) if goals else 0
+
+def save_goal_index():
+    """Write every goal except its contribution log, which is appended to separately"""
+    store_dir = get_goal_store_dir()
+    if store_dir is None:
+        return
+
+    index = {goal_id: {key: value for key, value in goal.items() if key != "contributions"} for goal_id, goal in st.session_state.goals.items()}
+    with open_private(os.path.join(store_dir, "goals.json")) as index_file:
+        json.dump(index, index_file)
+
+def load_goal_store():
+    """Load the user's saved goals and contribution logs into session state"""
+    store_dir = get_goal_store_dir()
+    if store_dir is None or not os.path.exists(os.path.join(store_dir, "goals.json")):
+        return
+    index_path = os.path.join(store_dir, "goals.json")
+
+    with open(index_path, encoding="utf-8") as index_file:
+        goals = json.load(index_file)
+
+    st.session_state.goals = {}
+    st.session_state.goal_metrics = {'count': 0, 'progress_sum': 0.0}
+    for goal_id, goal in goals.items():
+        log_path = os.path.join(get_goal_store_dir(), f"{goal_id}.jsonl")
+        if os.path.exists(log_path):
+            with open(log_path, encoding="utf-8") as log_file:
+                goal["contributions"] = [json.loads(line) for line in log_file]
+        else:
+            goal["contributions"] = []
+        st.session_state.goals[goal_id] = goal
+        track_goal_metrics(goal, 1)
+    st.session_state.goals_version = st.session_state.get('goals_version', 0) + 1
+
+def add_goal(name, target, current, date):
+    """Create a goal under a new stable id and return the id"""
+    goal_id = uuid.uuid4().hex[:12]
+    goal = {
+        "id": goal_id,
+        "name": name,
+        "target": target,
+        "current": current,
+        "date": date,
+        "created": datetime.now().strftime("%Y-%m-%d"),
+        "contributions": []
+    }
+
+    st.session_state.goals[goal_id] = goal
+    track_goal_metrics(goal, 1)
+    st.session_state.goals_version += 1
+    save_goal_index()
+
+    return goal_id
+
+def update_goal(goal_id, **fields):
+    """Update a goal in place by id, logging any change to its saved amount as a contribution"""
+    goal = st.session_state.goals[goal_id]
+    track_goal_metrics(goal, -1)
+
+    if "current" in fields and fields["current"] != goal["current"]:
+        record_goal_contribution(goal, fields["current"] - goal["current"])
+    goal.update(fields)
+
+    track_goal_metrics(goal, 1)
+    st.session_state.goals_version += 1
+    save_goal_index()
+
+def delete_goal(goal_id):
+    """Delete a goal by id along with its contribution log"""
+    goal = st.session_state.goals.pop(goal_id)
+    track_goal_metrics(goal, -1)
+    st.session_state.goals_version += 1
+
+    store_dir = get_goal_store_dir()
+    if store_dir is not None and os.path.exists(os.path.join(store_dir, f"{goal_id}.jsonl")):
+        os.remove(os.path.join(store_dir, f"{goal_id}.jsonl"))
+    save_goal_index()
+
+    if st.session_state.get('editing_goal') == goal_id:
+        st.session_state.editing_goal = None
+
+def clear_goal_store():
+    """Delete the user's saved goals from disk"""
+    store_dir = get_goal_store_dir()
+    if store_dir is not None:
+        shutil.rmtree(store_dir, ignore_errors=True)
+
+def forecast_goals(goals, today=None, n_simulations=GOAL_SIMULATIONS, seed=42):
+    """
+    Project completion for all goals in one vectorized pass.
+    Each goal's monthly contribution rate and its spread come from its contribution log, counting
+    months without contributions as zero. The on-time probability is a Monte Carlo over both the
+    uncertainty of the rate and month-to-month variability.
+    Goals without a creation date are assumed to have started a year before their target.
+    Accepts the goal store (indexed by goal id in the result) or a list of goals.
+    """
+    today = pd.Timestamp(today if today is not None else datetime.now()).normalize()
+
+    # A goal store is forecast under its goal ids, a plain list under positions
+    goal_ids = list(goals.keys()) if isinstance(goals, dict) else list(range(len(goals)))
+    goals = list(goals.values()) if isinstance(goals, dict) else list(goals)
+
+    n_goals = len(goals)
+    if n_goals == 0:
+        return pd.DataFrame(columns=["name", "remaining", "monthly_rate", "monthly_std", "projected_date",
+                                     "on_time_probability", "expected_progress", "progress"])
+
+    targets = np.array([goal["target"] for goal in goals], dtype=float)
+    currents = np.array([goal["current"] for goal in goals], dtype=float)
+    target_dates = pd.to_datetime([goal["date"] for goal in goals])
+    created = pd.to_datetime([goal.get("created") for goal in goals])
+    created = created.where(created.notna(), target_dates - pd.Timedelta(days=365))
+
+    # Goal x month contribution matrix, months counted from each goal's creation month
+    created_keys = (created.year * 12 + created.month).to_numpy()
+    months_observed = np.maximum(today.year * 12 + today.month - created_keys + 1, 1)
+    n_months = int(months_observed.max())
+
+    log = [(position, entry["date"], entry["amount"]) for position, goal in enumerate(goals) for entry in goal.get("contributions", [])]
+    contributions = np.zeros((n_goals, n_months))
+    if log:
+        positions, dates, amounts = zip(*log)
+        positions = np.array(positions)
+        dates = pd.to_datetime(list(dates))
+        offsets = np.clip((dates.year * 12 + dates.month).to_numpy() - created_keys[positions], 0, n_months - 1)
+        contributions = np.bincount(positions * n_months + offsets, weights=np.array(amounts), minlength=n_goals * n_months).reshape(n_goals, n_months)
+
+    observed = np.arange(n_months)[None, :] < months_observed[:, None]
+    has_history = np.array([bool(goal.get("contributions")) for goal in goals])
+    monthly_rate = contributions.sum(axis=1) / months_observed
+    squared_deviation = np.where(observed, (contributions - monthly_rate[:, None]) ** 2, 0.0).sum(axis=1)
+    monthly_std = np.sqrt(squared_deviation / np.maximum(months_observed - 1, 1))
+
+    # Deterministic projection at the observed rate
+    remaining = np.maximum(targets - currents, 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        months_needed = np.where(remaining <= 0, 0.0, np.where(monthly_rate > 0, remaining / monthly_rate, np.inf))
+    reachable = np.isfinite(months_needed) & (months_needed < 1200)
+    projected_date = pd.Series(pd.NaT, index=range(n_goals), dtype="datetime64[ns]")
+    projected_date[reachable] = today + pd.to_timedelta(np.ceil(months_needed[reachable] * DAYS_PER_MONTH), unit="D")
+
+    # Monte Carlo: sample the rate within its uncertainty, then the sum of the months left around it
+    months_left = np.maximum((target_dates - today).days.to_numpy() / DAYS_PER_MONTH, 0.0)
+    rng = np.random.default_rng(seed)
+    sampled_rate = monthly_rate + monthly_std / np.sqrt(months_observed) * rng.standard_normal((n_simulations, n_goals))
+    sampled_total = months_left * sampled_rate + np.sqrt(months_left) * monthly_std * rng.standard_normal((n_simulations, n_goals))
+    on_time_probability = (sampled_total >= remaining).mean(axis=0)
+    on_time_probability = np.where(remaining <= 0, 1.0, np.where(has_history, on_time_probability, np.nan))
+
+    # Where the goal should be by now on a straight line from creation to target date
+    total_days = np.maximum((target_dates - created).days.to_numpy(), 1)
+    expected_progress = np.clip((today - created).days.to_numpy() / total_days, 0, 1) * 100
+
+    return pd.DataFrame({
+        "name": [goal["name"] for goal in goals],
+        "remaining": remaining,
+        "monthly_rate": np.where(has_history, monthly_rate, np.nan),
+        "monthly_std": np.where(has_history, monthly_std, np.nan),
+        "projected_date": projected_date.to_numpy(),
+        "on_time_probability": on_time_probability,
+        "expected_progress": expected_progress,
+        "progress": np.minimum(currents / targets, 1) * 100
+    }, index=goal_ids)
+
  # Dashboard components
 def display_dashboard():
      st.markdown("<h2>Dashboard</h2>", unsafe_allow_html=True)
@@ -814,6 +2198,15 @@ def display_dashboard():
          else:
              st.info("No transaction data available. Add transactions to view your spending analysis.")
 
+     # Spending alerts from the streaming anomaly detector
+     if not st.session_state.transactions.empty:
+         alerts = get_spending_alerts(st.session_state.transactions)
+         if not alerts.empty:
+             st.markdown("<h3>Spending Alerts</h3>", unsafe_allow_html=True)
+             for _, alert in alerts.tail(3).iloc[::-1].iterrows():
+                 st.warning(f"{alert['date']} • {alert['description']}: €{abs(alert['amount']):.2f} on {alert['category']}, "
+                            f"well above your usual {alert['category']} spending.")
+
      # AI Insights
      st.markdown("<h3>AI Financial Insights</h3>", unsafe_allow_html=True)
 
@@ -829,11 +2222,22 @@ def display_dashboard():
 
      # Predict future expenses
      st.markdown("<h3>Future Expense Predictions</h3>", unsafe_allow_html=True)
-     predictions = predict_future_expenses()
-     if predictions is not None:
+     forecast = predict_future_expenses()
+     if forecast is not None:
          st.write("Predicted expenses for the next 3 months:")
-         for i, prediction in enumerate(predictions, start=1):
-             st.write(f"Month {i}: €{prediction:.2f}")
+         totals = forecast[forecast['category'] == 'Total']
+         for i, row in enumerate(totals.itertuples(), start=1):
+             st.write(f"Month {i} ({row.month}): €{row.forecast:.2f} (likely between €{row.lower:.2f} and €{row.upper:.2f})")
+
+         fig = px.bar(
+             forecast[forecast['category'] != 'Total'],
+             x='month',
+             y='forecast',
+             color='category',
+             title='Predicted Spending by Category'
+         )
+         fig.update_layout(height=300)
+         st.plotly_chart(fig, use_container_width=True)
      else:
          st.info("Not enough data to make predictions.")
 
@@ -843,7 +2247,7 @@ def display_dashboard():
      if st.session_state.goals:
          col1, col2 = st.columns(2)
 
-         for i, goal in enumerate(st.session_state.goals):
+         for i, goal in enumerate(st.session_state.goals.values()):
              progress = (goal["current"] / goal["target"]) * 100
              with col1 if i % 2 == 0 else col2:
                  st.markdown(f"""
@@ -991,6 +2395,16 @@ def display_transactions():
      tab1, tab2 = st.tabs(["Transactions", "Cash Flow Analysis"])
 
      with tab1:
+         # Alert raised by the last transaction added
+         alert = st.session_state.pop("pending_alert", None)
+         if alert:
+             st.warning(f"Unusual expense: €{abs(alert['amount']):.2f} on {alert['category']} is "
+                        f"{alert['z_score']:.1f} standard deviations above your usual {alert['category']} spending.")
+         budget_alert = st.session_state.pop("pending_budget_alert", None)
+         if budget_alert:
+             st.warning(f"You're €{-budget_alert['remaining']:.2f} over your {budget_alert['category']} budget this month "
+                        f"(€{budget_alert['spent']:.2f} spent of €{budget_alert['available']:.2f}).")
+
          # Add transaction form
          st.subheader("Add New Transaction")
 
@@ -1001,7 +2415,7 @@ def display_transactions():
                  transaction_date = st.date_input("Date", value=datetime.now())
                  transaction_category = st.selectbox(
                      "Category",
-                     ["Income", "Groceries", "Dining", "Entertainment", "Transport", "Shopping", "Utilities", "Other"]
+                     TRANSACTION_CATEGORIES + ["Auto-detect"]
                  )
 
              with col2:
@@ -1011,6 +2425,12 @@ def display_transactions():
              submit_tx = st.form_submit_button("Add Transaction")
 
              if submit_tx:
+                 # Let the categorizer pick from the description, or learn from the user's choice
+                 if transaction_category == "Auto-detect":
+                     transaction_category = categorize_transactions(pd.Series([transaction_description])).iloc[0]
+                 else:
+                     learn_transaction_categories([transaction_description], [transaction_category])
+
                  # Determine transaction type
                  tx_type = "income" if transaction_category == "Income" else "expense"
                  tx_amount = transaction_amount if tx_type == "income" else -transaction_amount
@@ -1029,6 +2449,18 @@ def display_transactions():
                      st.session_state.transactions = new_tx
                  else:
                      st.session_state.transactions = pd.concat([st.session_state.transactions, new_tx], ignore_index=True)
+                 st.session_state.ledger_version += 1
+
+                 # Add the expense to its envelope and warn once it runs over
+                 envelopes = get_budget_envelopes(st.session_state.transactions)
+                 if tx_type == "expense" and transaction_category in st.session_state.budget_limits:
+                     status = envelope_status(envelopes, transaction_category)
+                     if status["overspent"]:
+                         st.session_state.pending_budget_alert = status
+
+                 # Classify into the existing spending clusters instead of refitting
+                 if 'ml_models' in st.session_state:
+                     add_transactions_to_clusters(st.session_state.ml_models['spending_clusters'], new_tx)
 
                  # Update balance
                  if tx_type == "income":
@@ -1043,6 +2475,11 @@ def display_transactions():
                          roundup = 1 - cents
                          st.session_state.roundups += roundup
 
+                 # Score the new expense right away, the alert is shown after the rerun
+                 alerts = get_spending_alerts(st.session_state.transactions)
+                 if tx_type == "expense" and not alerts.empty and alerts.index[-1] == st.session_state.transactions.index[-1]:
+                     st.session_state.pending_alert = alerts.iloc[-1].to_dict()
+
                  st.success("Transaction added successfully!")
                  st.rerun()
 
@@ -1060,32 +2497,28 @@ def display_transactions():
          with col3:
              filter_category = st.multiselect(
                  "Categories",
-                 ["All"] + ["Income", "Groceries", "Dining", "Entertainment", "Transport", "Shopping", "Utilities", "Other"],
+                 ["All"] + TRANSACTION_CATEGORIES,
                  default=["All"]
              )
 
          # Apply filters
          if not st.session_state.transactions.empty:
-             filtered_transactions = st.session_state.transactions.copy()
-
-             # Convert date strings to datetime objects for comparison
-             filtered_transactions['date'] = pd.to_datetime(filtered_transactions['date'])
+             # Filter on the already parsed dates from the feature store
+             features = get_transaction_features(st.session_state.transactions)
 
              # Date filter
-             mask = (filtered_transactions['date'] >= pd.Timestamp(filter_start_date)) & \
-                    (filtered_transactions['date'] <= pd.Timestamp(filter_end_date))
-             filtered_transactions = filtered_transactions[mask]
+             mask = (features['date'] >= pd.Timestamp(filter_start_date)) & \
+                    (features['date'] <= pd.Timestamp(filter_end_date))
 
              # Category filter
              if "All" not in filter_category:
-                 filtered_transactions = filtered_transactions[filtered_transactions['category'].isin(filter_category)]
+                 mask &= features['category'].isin(filter_category)
 
-             # Display filtered transactions
-             if not filtered_transactions.empty:
-                 # Convert dates back to string for display
-                 display_transactions = filtered_transactions.copy()
-                 display_transactions['date'] = display_transactions['date'].dt.strftime('%Y-%m-%d')
+             # Select from a read-only view, the ledger keeps its display-ready date strings
+             display_transactions = get_ledger_view(st.session_state.transactions)[mask]
 
+             # Display filtered transactions
+             if not display_transactions.empty:
                  st.dataframe(
                      display_transactions[["date", "category", "amount", "description"]],
                      use_container_width=True,
@@ -1110,23 +2543,25 @@ def display_transactions():
              # Prepare data for cash flow analysis
              st.subheader("Monthly Cash Flow")
 
-             # Convert date to datetime if it's not already
-             transactions_df = st.session_state.transactions.copy()
-             transactions_df['date'] = pd.to_datetime(transactions_df['date'])
+             # Read the parsed dates from the feature store instead of copying the ledger
+             transactions_df = get_transaction_features(st.session_state.transactions)
 
-             # Extract month for grouping
-             transactions_df['month'] = transactions_df['date'].dt.strftime('%Y-%m')
+             # Extract month for grouping, labels are formatted after aggregation
+             transactions_df['month'] = transactions_df['date'].dt.to_period('M')
 
              # Group by month and transaction type
-             monthly_flow = transactions_df.groupby(['month', 'type'])['amount'].sum().reset_index()
+             monthly_flow = transactions_df.groupby(['month', 'type'], observed=True)['amount'].sum().reset_index()
 
              # Pivot to get income and expenses side by side
              pivot_df = monthly_flow.pivot_table(
                  index='month',
                  columns='type',
                  values='amount',
-                 aggfunc='sum'
+                 aggfunc='sum',
+                 observed=True
              ).reset_index().fillna(0)
+             pivot_df.columns = [str(column) for column in pivot_df.columns]
+             pivot_df['month'] = pivot_df['month'].astype(str)
 
              # Make sure both columns exist
              if 'income' not in pivot_df.columns:
@@ -1162,7 +2597,7 @@ def display_transactions():
 
              if not expenses.empty:
                  # Group by category
-                 category_expenses = expenses.groupby('category')['amount'].sum().abs().reset_index()
+                 category_expenses = expenses.groupby('category', observed=True)['amount'].sum().abs().reset_index()
                  category_expenses = category_expenses.sort_values('amount', ascending=False)
 
                  fig = px.bar(
@@ -1181,7 +2616,8 @@ def display_transactions():
                  st.subheader("Spending Trends")
 
                  # Group by month and category
-                 category_month = expenses.groupby(['month', 'category'])['amount'].sum().abs().reset_index()
+                 category_month = expenses.groupby(['month', 'category'], observed=True)['amount'].sum().abs().reset_index()
+                 category_month['month'] = category_month['month'].astype(str)
 
                  fig = px.line(
                      category_month,
@@ -1195,6 +2631,40 @@ def display_transactions():
                  st.plotly_chart(fig, use_container_width=True)
              else:
                  st.info("No expense transactions available for analysis.")
+
+             # Balance history from the checkpoint index
+             st.subheader("Balance Over Time")
+
+             history = balance_history(get_balance_checkpoints(st.session_state.transactions), st.session_state.balance)
+
+             fig = px.line(
+                 x=history.index,
+                 y=history.values,
+                 labels={'x': 'Date', 'y': 'Balance (€)'},
+                 title='Daily Balance'
+             )
+             fig.update_layout(height=400)
+             st.plotly_chart(fig, use_container_width=True)
+
+             # Day-level balance projection with overdraft early warning
+             st.subheader("90-Day Balance Projection")
+
+             projection = project_cash_flow(st.session_state.transactions, st.session_state.balance)
+
+             fig = px.line(
+                 x=projection['dates'],
+                 y=projection['balances'][0],
+                 labels={'x': 'Date', 'y': 'Projected Balance (€)'},
+                 title='Projected Daily Balance'
+             )
+             fig.update_layout(height=400)
+             st.plotly_chart(fig, use_container_width=True)
+
+             overdraft_date = projection['overdraft_dates'].iloc[0]
+             if pd.notna(overdraft_date):
+                 st.error(f"Your balance is projected to drop below zero on {overdraft_date:%Y-%m-%d}. Consider moving money or cutting back before then.")
+             else:
+                 st.success("No overdraft projected for the next 90 days.")
          else:
              st.info("Add transactions to see your cash flow analysis.")
 
@@ -1206,14 +2676,25 @@ def display_transactions():
 
                  st.success("Analysis complete!")
 
-                 st.markdown("""
+                 # Recurring payments come from the detector rather than a fixed message
+                 recurring = get_recurring_charges(st.session_state.transactions)
+                 bills = recurring[recurring["type"] == "expense"]
+                 if not bills.empty:
+                     monthly_cost = (-bills["amount"] * 30.44 / bills["period_days"]).sum()
+                     next_bill = bills.sort_values("next_date").iloc[0]
+                     expected = "was due on" if next_bill['next_date'] < pd.Timestamp(datetime.now()).normalize() else "expected on"
+                     recurring_insight = f"We've detected {len(bills)} recurring payments totaling €{monthly_cost:.2f}/month. The next one is {next_bill['merchant']} (€{-next_bill['amount']:.2f}, {next_bill['period']}) {expected} {next_bill['next_date']:%Y-%m-%d}."
+                 else:
+                     recurring_insight = "We haven't detected any recurring payments yet. They show up once a charge repeats at least three times."
+
+                 st.markdown(f"""
                  ### AI Spending Insights
 
                  1. **Unusual Spending**: Your entertainment spending is 40% higher than your average. Consider setting a budget in this category.
 
                  2. **Savings Opportunity**: You spend an average of €45 per week on coffee shops. Reducing this by half could save you €1,170 per year.
 
-                 3. **Recurring Payments**: We've detected 3 subscription services totaling €29.97/month that you haven't used in the last 60 days.
+                 3. **Recurring Payments**: {recurring_insight}
                  """)
          else:
              st.warning("Upgrade to Pro or Elite to access AI-powered spending analysis.")
@@ -1242,15 +2723,8 @@ def display_goals():
          submit_new_goal = st.form_submit_button("Add Goal")
 
          if submit_new_goal and goal_name:
-             # Add the goal to session state
-             new_goal = {
-                 "name": goal_name,
-                 "target": goal_target,
-                 "current": goal_current,
-                 "date": goal_date.strftime("%Y-%m-%d")
-             }
-
-             st.session_state.goals.append(new_goal)
+             # Add the goal to the goal store
+             add_goal(goal_name, goal_target, goal_current, goal_date.strftime("%Y-%m-%d"))
              st.success(f"Goal '{goal_name}' added!")
              st.rerun()
 
@@ -1258,8 +2732,12 @@ def display_goals():
      if st.session_state.goals:
          st.subheader("Your Financial Goals")
 
-         for i, goal in enumerate(st.session_state.goals):
+         # Forecast every goal in one pass
+         goal_forecast = forecast_goals(st.session_state.goals)
+
+         for goal_id, goal in st.session_state.goals.items():
              progress = (goal["current"] / goal["target"]) * 100
+             forecast = goal_forecast.loc[goal_id]
              months_to_target = None
 
              # Calculate time to target
@@ -1285,6 +2763,13 @@ def display_goals():
                      <p style="margin-top: 0.5rem;">Target date: {goal["date"]}</p>
                      """, unsafe_allow_html=True)
 
+                 if pd.notna(forecast["on_time_probability"]):
+                     projected = f"{forecast['projected_date']:%Y-%m-%d}" if pd.notna(forecast["projected_date"]) else "not at your current pace"
+                     st.markdown(f"""
+                     <p>Saving €{forecast["monthly_rate"]:.2f}/month, projected completion: <strong>{projected}</strong>
+                     ({forecast["on_time_probability"]:.0%} chance of reaching it by the target date)</p>
+                     """, unsafe_allow_html=True)
+
                  if months_to_target is not None and months_to_target > 0:
                      monthly_contribution = (goal["target"] - goal["current"]) / months_to_target
                      st.markdown(f"""
@@ -1295,24 +2780,24 @@ def display_goals():
                      st.markdown("</div>", unsafe_allow_html=True)
 
              with col2:
-                 if st.button(f"Update", key=f"update_goal_{i}"):
-                     st.session_state.editing_goal = i
+                 if st.button(f"Update", key=f"update_goal_{goal_id}"):
+                     st.session_state.editing_goal = goal_id
                      st.rerun()
 
              with col3:
-                 if st.button(f"Delete", key=f"delete_goal_{i}"):
-                     st.session_state.goals.pop(i)
+                 if st.button(f"Delete", key=f"delete_goal_{goal_id}"):
+                     delete_goal(goal_id)
                      st.success("Goal deleted successfully!")
                      st.rerun()
 
-         # Goal editing form (appears when Update is clicked)
-         if 'editing_goal' in st.session_state and st.session_state.editing_goal is not None:
-             i = st.session_state.editing_goal
-             goal = st.session_state.goals[i]
+         # Goal editing form (appears when Update is clicked), keyed by id so deletes cannot shift it
+         editing_id = st.session_state.get('editing_goal')
+         if editing_id is not None and editing_id in st.session_state.goals:
+             goal = st.session_state.goals[editing_id]
 
              st.subheader(f"Update Goal: {goal['name']}")
 
-             with st.form(f"update_goal_form_{i}"):
+             with st.form(f"update_goal_form_{editing_id}"):
                  updated_name = st.text_input("Goal Name", value=goal["name"])
                  updated_target = st.number_input("Target Amount (€)", value=goal["target"], min_value=1.0)
                  updated_current = st.number_input("Current Amount (€)", value=goal["current"], min_value=0.0)
@@ -1329,13 +2814,14 @@ def display_goals():
                          st.rerun()
 
                  if update_button:
-                     # Update the goal
-                     st.session_state.goals[i] = {
-                         "name": updated_name,
-                         "target": updated_target,
-                         "current": updated_current,
-                         "date": updated_date.strftime("%Y-%m-%d")
-                     }
+                     # Update the goal, a changed amount goes into its contribution log
+                     update_goal(
+                         editing_id,
+                         name=updated_name,
+                         target=updated_target,
+                         current=updated_current,
+                         date=updated_date.strftime("%Y-%m-%d")
+                     )
 
                      st.success("Goal updated successfully!")
                      st.session_state.editing_goal = None
@@ -1545,7 +3031,7 @@ def display_profile():
                      "investments": st.session_state.investments
                  },
                  "transactions": st.session_state.transactions.to_dict(orient="records") if not st.session_state.transactions.empty else [],
-                 "goals": st.session_state.goals
+                 "goals": list(st.session_state.goals.values())
              }
 
              # Convert to JSON
@@ -1567,9 +3053,11 @@ def display_profile():
              if st.button("Reset App Data", type="primary"):
                  st.warning("This will reset all your data. Are you sure?")
                  if st.button("Yes, Reset Everything", key="confirm_reset"):
-                     # Reset all session state
+                     # Reset all session state, staying logged in as the same user
+                     clear_chat_archive()
+                     clear_goal_store()
                      for key in list(st.session_state.keys()):
-                         if key != 'login_status' and key != 'current_page':
+                         if key not in ('login_status', 'current_page', 'user_id', 'username'):
                              del st.session_state[key]
 
                      # Initialize default values
@@ -1577,8 +3065,12 @@ def display_profile():
                      st.session_state.balance = 0.0
                      st.session_state.savings = 0.0
                      st.session_state.investments = 0.0
-                     st.session_state.goals = []
+                     st.session_state.goals = {}
+                     st.session_state.goal_metrics = {'count': 0, 'progress_sum': 0.0}
+                     st.session_state.goals_version = 0
                      st.session_state.transactions = pd.DataFrame(columns=["date", "category", "amount", "description", "type"])
+                     st.session_state.ledger_version = 0
+                     st.session_state.budget_limits = {}
                      st.session_state.insights = []
                      st.session_state.roundups = 0.0
                      st.session_state.first_login = True
@@ -1595,6 +3087,9 @@ def display_profile():
                      st.session_state.current_page = 'login'
 
                      # Reset all session state
+                     clear_chat_archive(all_sessions=True)
+                     clear_goal_store()
+                     delete_user(st.session_state.get('username'))
                      for key in list(st.session_state.keys()):
                          if key != 'login_status' and key != 'current_page':
                              del st.session_state[key]
@@ -1602,6 +3097,545 @@ def display_profile():
                      st.rerun()
 
 # AI Assistant feature
+# AI assistant query engine: questions are parsed into intents and answered from the rollup indexes
+ASSISTANT_CATEGORY_TERMS = {
+    "Dining": ["dining", "dine", "restaurant", "restaurants", "eating out", "takeaway"],
+    "Groceries": ["grocery", "groceries", "supermarket"],
+    "Entertainment": ["entertainment", "movies", "streaming"],
+    "Transport": ["transport", "transportation", "travel", "commute", "fuel"],
+    "Shopping": ["shopping", "clothes"],
+    "Utilities": ["utilities", "utility", "bills"]
+}
+
+ASSISTANT_CATEGORY_PATTERN = re.compile(r"\b(" + "|".join(
+    sorted((re.escape(term) for terms in ASSISTANT_CATEGORY_TERMS.values() for term in terms), key=len, reverse=True)
+) + r")\b")
+ASSISTANT_CATEGORY_LOOKUP = {term: category for category, terms in ASSISTANT_CATEGORY_TERMS.items() for term in terms}
+
+# First matching metric wins, so the more specific phrasings come first
+ASSISTANT_METRICS = [
+    ("budget_tips", re.compile(r"\bimprove\b.*\bbudget\b|\bbudget(?:ing)? tips?\b")),
+    ("goals", re.compile(r"\bgoals?\b")),
+    ("savings_rate", re.compile(r"\bsavings? rate\b")),
+    ("biggest_category", re.compile(r"\b(?:biggest|largest|top|highest)\b.*\b(?:expense|category|spending)\b")),
+    ("balance", re.compile(r"\bbalance\b")),
+    ("income", re.compile(r"\b(?:income|earn|earned|salary)\b")),
+    ("spend", re.compile(r"\b(?:spend|spent|spending|expenses?|cost)\b"))
+]
+
+ASSISTANT_PERIODS = [
+    (re.compile(r"\b(?:last|past) (\d+) days?\b"), None),
+    (re.compile(r"\b(?:last|past) week\b"), 7),
+    (re.compile(r"\b(?:last|past) month\b"), 30),
+    (re.compile(r"\b(?:last|past) quarter\b"), 90),
+    (re.compile(r"\b(?:last|past) year\b"), 365)
+]
+
+# "This month" and friends mean the calendar period so far, not a trailing window
+ASSISTANT_CALENDAR_PATTERN = re.compile(r"\bthis (week|month|quarter|year)\b")
+CALENDAR_FREQS = {"week": "W", "month": "M", "quarter": "Q", "year": "Y"}
+
+def calendar_period_days(unit, today=None):
+    """Days from the start of the current calendar week, month, quarter or year up to today, inclusive"""
+    today = pd.Timestamp(today if today is not None else datetime.now()).normalize()
+    return (today - today.to_period(CALENDAR_FREQS[unit]).start_time).days + 1
+
+ASSISTANT_DATE_PATTERN = re.compile(r"\b(\d{4}-\d{2}-\d{2})\b")
+
+def parse_assistant_query(query):
+    """
+    Parse a question into an intent: metric, category, window in days (None = all time),
+    the calendar period that window covers if any, and date
+    """
+    text = query.lower()
+
+    metric = next((name for name, pattern in ASSISTANT_METRICS if pattern.search(text)), None)
+
+    match = ASSISTANT_CATEGORY_PATTERN.search(text)
+    category = ASSISTANT_CATEGORY_LOOKUP[match.group(1)] if match else None
+    if metric is None and category is not None:
+        metric = "spend"
+
+    days = None
+    calendar = None
+    match = ASSISTANT_CALENDAR_PATTERN.search(text)
+    if match:
+        calendar = match.group(1)
+        days = calendar_period_days(calendar)
+    else:
+        for pattern, period_days in ASSISTANT_PERIODS:
+            match = pattern.search(text)
+            if match:
+                days = period_days if period_days is not None else int(match.group(1))
+                break
+
+    match = ASSISTANT_DATE_PATTERN.search(text)
+    date = match.group(1) if match else None
+
+    intent = {"metric": metric or "unknown", "category": category, "days": days, "calendar": calendar, "date": date}
+    if intent["metric"] == "spend":
+        intent["plan"] = compile_spend_query(text)
+    return intent
+
+# Spend query compiler: a small grammar over categories, aggregates, grains and periods
+MONTH_NAMES = {
+    "january": 1, "february": 2, "march": 3, "april": 4, "may": 5, "june": 6, "july": 7,
+    "august": 8, "september": 9, "october": 10, "november": 11, "december": 12,
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "jun": 6, "jul": 7, "aug": 8, "sep": 9, "sept": 9, "oct": 10, "nov": 11, "dec": 12
+}
+MONTH_PATTERN = "|".join(sorted(MONTH_NAMES, key=len, reverse=True))
+
+SPEND_AGGREGATES = [
+    ("average", re.compile(r"\b(?:average|avg|mean|typical)\b")),
+    ("count", re.compile(r"\b(?:how many|number of|count)\b"))
+]
+
+SPEND_GRAINS = [
+    ("D", re.compile(r"\b(?:daily|per day|a day)\b")),
+    ("W", re.compile(r"\b(?:weekly|per week|a week)\b")),
+    ("M", re.compile(r"\b(?:monthly|per month|a month)\b"))
+]
+GRAIN_DAYS = {"D": 1, "W": 7, "M": DAYS_PER_MONTH}
+GRAIN_NAMES = {"D": "day", "W": "week", "M": "month"}
+
+# Period rules in priority order, each maps its match to a symbolic period resolved at execution time
+SPEND_PERIODS = [
+    (re.compile(r"\bsince (\d{4}-\d{2}-\d{2})\b"),
+     lambda m: {"kind": "since_date" if pd.notna(pd.to_datetime(m.group(1), errors="coerce")) else "invalid_date", "date": m.group(1)}),
+    (re.compile(r"\bsince (" + MONTH_PATTERN + r")\b(?: (\d{4}))?"),
+     lambda m: {"kind": "since_month", "month": MONTH_NAMES[m.group(1)], "year": int(m.group(2)) if m.group(2) else None}),
+    (re.compile(r"\bq([1-4])\b(?: (\d{4}))?"),
+     lambda m: {"kind": "quarter", "quarter": int(m.group(1)), "year": int(m.group(2)) if m.group(2) else None}),
+    (re.compile(r"\b(?:in|during) (" + MONTH_PATTERN + r")\b(?: (\d{4}))?"),
+     lambda m: {"kind": "month", "month": MONTH_NAMES[m.group(1)], "year": int(m.group(2)) if m.group(2) else None}),
+    (re.compile(r"\b(?:in|during) (\d{4})\b"), lambda m: {"kind": "year", "year": int(m.group(1))}),
+    (re.compile(r"\b(?:last|past) (\d+) (day|week|month)s?\b"),
+     lambda m: {"kind": "trailing", "days": int(round(int(m.group(1)) * GRAIN_DAYS[m.group(2)[0].upper()]))}),
+    (re.compile(r"\bthis (week|month|quarter|year)\b"), lambda m: {"kind": "calendar", "unit": m.group(1)}),
+    (re.compile(r"\b(?:last|past) (week|month|quarter|year)\b"),
+     lambda m: {"kind": "trailing", "days": {"week": 7, "month": 30, "quarter": 90, "year": 365}[m.group(1)]})
+]
+
+QUERY_PLAN_CACHE_SIZE = 256
+
+def compile_spend_query(text):
+    """
+    Compile a spending question into a plan: categories, aggregate, grain and period.
+    Plans are cached per normalized question, so repeated questions skip the grammar.
+    """
+    text = " ".join(text.lower().split())
+
+    if 'query_plans' not in st.session_state:
+        st.session_state.query_plans = OrderedDict()
+    plans = st.session_state.query_plans
+    if text in plans:
+        plans.move_to_end(text)
+        return plans[text]
+
+    categories = []
+    for match in ASSISTANT_CATEGORY_PATTERN.finditer(text):
+        category = ASSISTANT_CATEGORY_LOOKUP[match.group(1)]
+        if category not in categories:
+            categories.append(category)
+
+    aggregate = next((name for name, pattern in SPEND_AGGREGATES if pattern.search(text)), "total")
+    grain = next((name for name, pattern in SPEND_GRAINS if pattern.search(text)), None)
+
+    # "Monthly dining spend" asks for a per-month figure, not the total over the period
+    if grain and aggregate == "total":
+        aggregate = "average"
+
+    period = {"kind": "all"}
+    for pattern, build_period in SPEND_PERIODS:
+        match = pattern.search(text)
+        if match:
+            period = build_period(match)
+            break
+
+    plan = {"categories": categories, "aggregate": aggregate, "grain": grain, "period": period}
+    plans[text] = plan
+    if len(plans) > QUERY_PLAN_CACHE_SIZE:
+        plans.popitem(last=False)
+
+    return plan
+
+def most_recent_year(month, today):
+    """Year of the most recent occurrence of a month that has already started"""
+    return today.year if month <= today.month else today.year - 1
+
+def resolve_spend_period(period, index, today=None):
+    """Turn a symbolic period into an inclusive start and end date plus its wording"""
+    today = pd.Timestamp(today if today is not None else datetime.now()).normalize()
+    kind = period["kind"]
+
+    if kind == "trailing":
+        return today - pd.Timedelta(days=period["days"] - 1), today, f"In the last {period['days']} days"
+    if kind == "calendar":
+        return today.to_period(CALENDAR_FREQS[period["unit"]]).start_time, today, f"This {period['unit']}"
+    if kind == "since_date":
+        start = pd.Timestamp(period["date"])
+        return start, today, f"Since {start:%B %d, %Y}"
+    if kind == "since_month":
+        year = period["year"] or most_recent_year(period["month"], today)
+        start = pd.Timestamp(year=year, month=period["month"], day=1)
+        return start, today, f"Since {start:%B %Y}"
+    if kind == "month":
+        year = period["year"] or most_recent_year(period["month"], today)
+        start = pd.Timestamp(year=year, month=period["month"], day=1)
+        return start, start + pd.offsets.MonthEnd(0), f"In {start:%B %Y}"
+    if kind == "quarter":
+        first_month = 3 * period["quarter"] - 2
+        year = period["year"] or most_recent_year(first_month, today)
+        start = pd.Timestamp(year=year, month=first_month, day=1)
+        return start, start + pd.offsets.QuarterEnd(0), f"In Q{period['quarter']} {year}"
+    if kind == "year":
+        start = pd.Timestamp(year=period["year"], month=1, day=1)
+        return start, start + pd.offsets.YearEnd(0), f"In {period['year']}"
+
+    # All time spans the whole ledger
+    start = index["start"]
+    return start, start + pd.Timedelta(days=index["n_days"] - 1), "In total"
+
+def execute_spend_plan(plan, index, today=None):
+    """
+    Run a compiled plan against the prefix-sum index: every requested category is one row
+    difference, so the cost does not depend on the ledger size.
+    """
+    start, end, label = resolve_spend_period(plan["period"], index, today)
+    begin = int(np.clip((start - index["start"]).days, 0, index["n_days"]))
+    stop = int(np.clip((end - index["start"]).days + 1, 0, index["n_days"]))
+    stop = max(stop, begin)
+
+    expense_columns = index["key_types"] == "expense"
+    amounts = pd.Series(index["amount"][stop, expense_columns] - index["amount"][begin, expense_columns], index=index["key_categories"][expense_columns])
+    counts = pd.Series(index["count"][stop, expense_columns] - index["count"][begin, expense_columns], index=index["key_categories"][expense_columns])
+
+    categories = plan["categories"] or ["All"]
+    if plan["categories"]:
+        amounts = amounts.reindex(categories, fill_value=0.0)
+        counts = counts.reindex(categories, fill_value=0)
+    else:
+        amounts = pd.Series([amounts.sum()], index=categories)
+        counts = pd.Series([counts.sum()], index=categories)
+
+    # Rates per day/week/month divide by the elapsed part of the period
+    elapsed_days = max((min(end, pd.Timestamp(today if today is not None else datetime.now()).normalize()) - start).days + 1, 1)
+    if plan["aggregate"] == "count" and plan["grain"]:
+        values = counts / (elapsed_days / GRAIN_DAYS[plan["grain"]])
+    elif plan["aggregate"] == "count":
+        values = counts.astype(float)
+    elif plan["aggregate"] == "average" and plan["grain"]:
+        values = amounts / (elapsed_days / GRAIN_DAYS[plan["grain"]])
+    elif plan["aggregate"] == "average":
+        values = amounts / counts.where(counts > 0)
+    else:
+        values = amounts
+
+    total_spend = index["amount"][stop, expense_columns].sum() - index["amount"][begin, expense_columns].sum()
+
+    return {"plan": plan, "label": label, "values": values.fillna(0.0), "amounts": amounts, "counts": counts, "total_spend": total_spend}
+
+def describe_spend_result(result):
+    """Word a plan's result as an assistant answer"""
+    plan, label, values = result["plan"], result["label"], result["values"]
+    if plan["period"]["kind"] == "all" and plan["aggregate"] != "total":
+        label = "Across your whole history"
+
+    def describe_value(category, value):
+        subject = "" if category == "All" else f" on {category}"
+        if plan["aggregate"] == "count":
+            kind = "" if category == "All" else f" {category}"
+            if plan["grain"]:
+                return f"about {value:.1f}{kind} transactions per {GRAIN_NAMES[plan['grain']]}"
+            return f"{int(value)}{kind} transactions"
+        if plan["aggregate"] == "average" and plan["grain"]:
+            return f"an average of €{value:.2f} per {GRAIN_NAMES[plan['grain']]}{subject}"
+        if plan["aggregate"] == "average":
+            return f"an average of €{value:.2f} per transaction{subject}"
+        return f"€{value:.2f}{subject}"
+
+    verb = "you made" if plan["aggregate"] == "count" else "you spent"
+
+    if len(values) == 1:
+        category, value = values.index[0], values.iloc[0]
+        response = f"{label}, {verb} {describe_value(category, value)}."
+        if category != "All" and plan["aggregate"] == "total":
+            if result["counts"].iloc[0] == 0:
+                return f"{label}, you have no {category} expenses recorded."
+            share = value / result["total_spend"] * 100 if result["total_spend"] > 0 else 0
+            response = (f"{label}, you spent €{value:.2f} on {category} across {int(result['counts'].iloc[0])} transactions. "
+                        f"This represents about {share:.0f}% of your total expenses during this period.")
+        return response
+
+    parts = [describe_value(category, value) for category, value in values.items()]
+    response = f"{label}, {verb} " + " vs ".join(parts) + "."
+    if len(values) == 2 and plan["aggregate"] != "count" and values.iloc[1] > 0:
+        difference = (values.iloc[0] - values.iloc[1]) / values.iloc[1] * 100
+        if abs(difference) < 1:
+            response += f" That is about the same on {values.index[0]} as on {values.index[1]}."
+        else:
+            direction = "more" if difference > 0 else "less"
+            response += f" That is {abs(difference):.0f}% {direction} on {values.index[0]} than on {values.index[1]}."
+    return response
+
+def resolve_query_window(index, days, calendar=None):
+    """Window length, end date and wording for an intent's period, all time spans the whole ledger"""
+    if days is None:
+        return index["n_days"], index["start"] + pd.Timedelta(days=index["n_days"] - 1), "In total"
+    if calendar is not None:
+        return days, None, f"This {calendar}"
+    return days, None, f"In the last {days} days"
+
+def answer_spend(intent):
+    index = get_window_index(st.session_state.transactions)
+    if index is None:
+        return "I don't have any transaction data yet. Add some transactions so I can analyze your spending."
+
+    if intent["plan"]["period"]["kind"] == "invalid_date":
+        return f"I couldn't read the date {intent['plan']['period']['date']}. Please use a real date in the form YYYY-MM-DD."
+
+    return describe_spend_result(execute_spend_plan(intent["plan"], index))
+
+def answer_income(intent):
+    index = get_window_index(st.session_state.transactions)
+    if index is None:
+        return "I don't have any income data yet. Please add your income transactions."
+
+    days, end, label = resolve_query_window(index, intent["days"], intent.get("calendar"))
+    income, count = window_totals(index, days, end, tx_type="income")
+    return f"{label}, you received €{income:.2f} of income across {count} transactions."
+
+def answer_savings_rate(intent):
+    index = get_window_index(st.session_state.transactions)
+    if index is None:
+        return "I don't have enough transaction data to calculate your savings rate yet. Please add some income and expense transactions."
+
+    days, end, label = resolve_query_window(index, intent["days"], intent.get("calendar"))
+    kpis = window_kpis(index, days, end)
+    if kpis["income"] <= 0:
+        return "I don't have enough income data to calculate your savings rate yet. Please add your income transactions."
+
+    period = "overall" if intent["days"] is None else label[0].lower() + label[1:] if intent.get("calendar") else f"over the last {days} days"
+    response = f"Your savings rate {period} is {kpis['savings_rate']:.1f}%. The recommended savings rate is at least 20%. "
+    if kpis["savings_rate"] < 20:
+        response += "You might want to look for ways to increase your savings rate."
+    else:
+        response += "Great job! You're on track with your savings."
+    return response
+
+def answer_biggest_category(intent):
+    index = get_window_index(st.session_state.transactions)
+    if index is None:
+        return "I don't have any transaction data yet. Please add some expense transactions so I can analyze your spending patterns."
+
+    days, end, label = resolve_query_window(index, intent["days"], intent.get("calendar"))
+    category_expenses = window_category_totals(index, days, end)
+    if category_expenses.empty:
+        return "I don't have enough expense data to determine your biggest category. Please add more expense transactions."
+
+    biggest_category = category_expenses.index[0]
+    biggest_amount = category_expenses.iloc[0]
+    return f"{label}, your biggest expense category is {biggest_category}, where you've spent €{biggest_amount:.2f}. This represents {(biggest_amount / category_expenses.sum()) * 100:.1f}% of your total expenses."
+
+def answer_balance(intent):
+    if intent["date"] is None:
+        return f"Your current balance is €{st.session_state.balance:.2f}."
+
+    when = pd.to_datetime(intent["date"], errors="coerce")
+    if pd.isna(when):
+        return f"I couldn't read the date {intent['date']}. Please use a real date in the form YYYY-MM-DD."
+
+    checkpoints = get_balance_checkpoints(st.session_state.transactions)
+    balance = balance_at(checkpoints, st.session_state.balance, when)
+    return f"Your balance at the end of {when:%Y-%m-%d} was €{balance:.2f}."
+
+def answer_goals(intent):
+    if not st.session_state.goals:
+        return "You don't have any financial goals set up yet. Let's set some goals to track your progress!"
+
+    forecast = forecast_goals(st.session_state.goals)
+
+    # Goals with a contribution history are judged by their on-time probability,
+    # the rest by progress against a straight line from creation to target date
+    on_track = np.where(
+        forecast["on_time_probability"].notna(),
+        forecast["on_time_probability"] >= 0.5,
+        forecast["progress"] >= forecast["expected_progress"] * 0.9
+    )
+    on_track_goals = [
+        f"{name} ({probability:.0%} chance on time)" if pd.notna(probability) else name
+        for name, probability in zip(forecast.loc[on_track, "name"], forecast.loc[on_track, "on_time_probability"])
+    ]
+    off_track_goals = [
+        f"{name} ({probability:.0%} chance on time)" if pd.notna(probability) else name
+        for name, probability in zip(forecast.loc[~on_track, "name"], forecast.loc[~on_track, "on_time_probability"])
+    ]
+
+    if on_track_goals and off_track_goals:
+        return f"You're on track with these goals: {', '.join(on_track_goals)}. However, you're falling behind on: {', '.join(off_track_goals)}. Consider adjusting your monthly contributions."
+    elif on_track_goals:
+        return f"Great news! You're on track with all your goals: {', '.join(on_track_goals)}. Keep up the good work!"
+    return f"You're currently behind on all your goals: {', '.join(off_track_goals)}. Let's review your budget to find ways to increase your contributions."
+
+def answer_budget_tips(intent):
+    return """Here are some ways to improve your budget:
+
+1. Track all expenses for at least 30 days to understand your spending patterns.
+2. Use the 50/30/20 rule: 50% for needs, 30% for wants, and 20% for savings.
+3. Identify and cut unnecessary subscriptions.
+4. Set specific financial goals to stay motivated.
+5. Review and adjust your budget monthly."""
+
+def answer_unknown(intent):
+    return ("I can answer questions about your spending, income, savings rate, balance and goals, "
+            "for example \"How much did I spend on groceries this month?\" or \"What was my balance on 2025-03-01?\"")
+
+ASSISTANT_ANSWERS = {
+    "spend": answer_spend,
+    "income": answer_income,
+    "savings_rate": answer_savings_rate,
+    "biggest_category": answer_biggest_category,
+    "balance": answer_balance,
+    "goals": answer_goals,
+    "budget_tips": answer_budget_tips,
+    "unknown": answer_unknown
+}
+
+ANSWER_CACHE_SIZE = 256
+
+def get_answer_cache():
+    """LRU of assistant answers kept in session state, with hit and miss counters"""
+    if 'answer_cache' not in st.session_state:
+        st.session_state.answer_cache = {"entries": OrderedDict(), "hits": 0, "misses": 0}
+    return st.session_state.answer_cache
+
+def answer_cache_key(intent):
+    """
+    Cache key for an intent: the intent itself plus the versions of the data it reads.
+    Trailing windows end today, so the date is part of the key; balance answers also depend on the balance.
+    """
+    return (
+        json.dumps(intent, sort_keys=True),
+        st.session_state.get('ledger_version', 0),
+        st.session_state.get('goals_version', 0),
+        datetime.now().date(),
+        st.session_state.balance if intent["metric"] == "balance" else None
+    )
+
+def answer_cache_stats():
+    """Hits, misses, hit rate and size of the answer cache"""
+    cache = get_answer_cache()
+    lookups = cache["hits"] + cache["misses"]
+    return {
+        "hits": cache["hits"],
+        "misses": cache["misses"],
+        "hit_rate": cache["hits"] / lookups if lookups else 0.0,
+        "size": len(cache["entries"])
+    }
+
+def answer_assistant_query(query):
+    """Route a question to the answer for its intent, reusing the cached answer while its data is unchanged"""
+    intent = parse_assistant_query(query)
+
+    cache = get_answer_cache()
+    key = answer_cache_key(intent)
+    response = cache["entries"].get(key)
+    if response is not None:
+        cache["hits"] += 1
+        cache["entries"].move_to_end(key)
+        return response
+
+    cache["misses"] += 1
+    response = ASSISTANT_ANSWERS[intent["metric"]](intent)
+    cache["entries"][key] = response
+    if len(cache["entries"]) > ANSWER_CACHE_SIZE:
+        cache["entries"].popitem(last=False)
+
+    return response
+
+# Bounded chat history: the latest turns stay in memory, older ones are archived to disk and paged back in
+CHAT_HISTORY_CAP = 50
+CHAT_ARCHIVE_PAGE = 20
+CHAT_ARCHIVE_ROOT = os.path.join(APP_DATA_DIR, "chat")
+CHAT_ARCHIVE_MAX_AGE_DAYS = 30
+
+def get_chat_history():
+    """Return the in-memory ring buffer of chat messages, creating it with the greeting on first use"""
+    if 'ai_messages' not in st.session_state:
+        st.session_state.ai_messages = deque(
+            [{"role": "assistant", "content": "Hi there! I'm your AI financial assistant. How can I help you today?"}],
+            maxlen=CHAT_HISTORY_CAP
+        )
+    return st.session_state.ai_messages
+
+def get_chat_archive_dir():
+    """Directory holding the logged-in user's chat archives, None before login"""
+    user_id = st.session_state.get('user_id')
+    if not user_id:
+        return None
+    return os.path.join(CHAT_ARCHIVE_ROOT, user_id)
+
+def prune_chat_archives(archive_dir, max_age_days=CHAT_ARCHIVE_MAX_AGE_DAYS):
+    """Delete the user's archives from earlier sessions that have not been written to for max_age_days"""
+    if not os.path.isdir(archive_dir):
+        return
+    cutoff = time.time() - max_age_days * 86400
+    for entry in os.scandir(archive_dir):
+        if entry.is_file() and entry.name.endswith(".jsonl") and entry.stat().st_mtime < cutoff:
+            os.remove(entry.path)
+
+def get_chat_archive():
+    """
+    Return this session's archive file and the byte offset of every archived message.
+    Before login there is nowhere private to archive to, so the path stays None and old turns are dropped.
+    """
+    archive = st.session_state.get('chat_archive')
+    if archive is None or archive["path"] is None:
+        archive_dir = get_chat_archive_dir()
+        if archive_dir is not None:
+            prune_chat_archives(archive_dir)
+        st.session_state.chat_archive = archive = {
+            "path": os.path.join(archive_dir, f"{uuid.uuid4().hex}.jsonl") if archive_dir is not None else None,
+            "offsets": []
+        }
+    return archive
+
+def append_chat_message(role, content):
+    """Add a message to the chat, archiving the oldest in-memory message once the buffer is full"""
+    history = get_chat_history()
+
+    if len(history) == history.maxlen:
+        archive = get_chat_archive()
+        if archive["path"] is not None:
+            with open_private(archive["path"], "a") as archive_file:
+                archive["offsets"].append(archive_file.tell())
+                archive_file.write(json.dumps(history[0]) + "\n")
+
+    history.append({"role": role, "content": content})
+
+def load_archived_messages(count):
+    """Read back the most recent archived messages, seeking straight to the first one needed"""
+    archive = get_chat_archive()
+    offsets = archive["offsets"]
+    if count <= 0 or not offsets:
+        return []
+
+    with open(archive["path"], encoding="utf-8") as archive_file:
+        archive_file.seek(offsets[max(len(offsets) - count, 0)])
+        return [json.loads(line) for line in archive_file]
+
+def clear_chat_archive(all_sessions=False):
+    """Delete this session's archive file, or every archive the user has with all_sessions"""
+    if all_sessions:
+        archive_dir = get_chat_archive_dir()
+        if archive_dir is not None:
+            shutil.rmtree(archive_dir, ignore_errors=True)
+        return
+
+    archive = st.session_state.get('chat_archive')
+    if archive and archive["path"] is not None and os.path.exists(archive["path"]):
+        os.remove(archive["path"])
+
 def display_ai_assistant():
     st.markdown("<h2>AI Financial Assistant</h2>", unsafe_allow_html=True)
 
@@ -1629,13 +3663,18 @@ def display_ai_assistant():
                     st.session_state.ai_query = question
 
         # Chat interface
-        if 'ai_messages' not in st.session_state:
-            st.session_state.ai_messages = [
-                {"role": "assistant", "content": "Hi there! I'm your AI financial assistant. How can I help you today?"}
-            ]
+        history = get_chat_history()
+
+        # Archived turns are only read from disk when the user pages back
+        archived_count = len(get_chat_archive()["offsets"])
+        shown_count = min(st.session_state.get('chat_archive_shown', 0), archived_count)
+        if shown_count < archived_count:
+            if st.button(f"Show earlier messages ({archived_count - shown_count} archived)"):
+                shown_count = min(shown_count + CHAT_ARCHIVE_PAGE, archived_count)
+                st.session_state.chat_archive_shown = shown_count
 
         # Display chat messages
-        for message in st.session_state.ai_messages:
+        for message in load_archived_messages(shown_count) + list(history):
             with st.chat_message(message["role"]):
                 st.write(message["content"])
 
@@ -1650,7 +3689,7 @@ def display_ai_assistant():
             st.session_state.ai_query = ""
 
             # Add user message to chat
-            st.session_state.ai_messages.append({"role": "user", "content": user_query})
+            append_chat_message("user", user_query)
 
             # Display user message
             with st.chat_message("user"):
@@ -1658,109 +3697,16 @@ def display_ai_assistant():
 
             # Generate AI response
             with st.chat_message("assistant"):
-                with st.spinner("Thinking..."):
-                    time.sleep(1)  # Simulate AI processing
-
-                    # Sample responses based on query keywords
-                    response = "I'm analyzing your financial data..."
-                    if "spend" in user_query.lower() and "dining" in user_query.lower():
-                        # Calculate dining expenses if we have transaction data
-                        if not st.session_state.transactions.empty:
-                            # Convert to datetime if needed
-                            transactions_df = st.session_state.transactions.copy()
-                            if not pd.api.types.is_datetime64_any_dtype(transactions_df['date']):
-                                transactions_df['date'] = pd.to_datetime(transactions_df['date'])
-
-                            # Filter for last month and dining category
-                            last_month = datetime.now() - timedelta(days=30)
-                            mask = (transactions_df['date'] >= last_month) & (transactions_df['category'] == 'Dining')
-                            dining_expenses = transactions_df[mask]['amount'].sum()
-
-                            response = f"In the last 30 days, you spent €{abs(dining_expenses):.2f} on dining out. This represents about 15% of your total expenses during this period."
-                        else:
-                            response = "You don't have any dining transactions recorded yet. Add some transactions so I can analyze your dining expenses."
-
-                    elif "savings rate" in user_query.lower():
-                        if not st.session_state.transactions.empty:
-                            # Calculate income and expenses
-                            transactions_df = st.session_state.transactions.copy()
-                            total_income = transactions_df[transactions_df['type'] == 'income']['amount'].sum()
-                            total_expenses = abs(transactions_df[transactions_df['type'] == 'expense']['amount'].sum())
-
-                            if total_income > 0:
-                                savings_rate = ((total_income - total_expenses) / total_income) * 100
-                                response = f"Your overall savings rate is {savings_rate:.1f}%. The recommended savings rate is at least 20%. "
-
-                                if savings_rate < 20:
-                                    response += "You might want to look for ways to increase your savings rate."
-                                else:
-                                    response += "Great job! You're on track with your savings."
-                            else:
-                                response = "I don't have enough income data to calculate your savings rate yet. Please add your income transactions."
-                        else:
-                            response = "I don't have enough transaction data to calculate your savings rate yet. Please add some income and expense transactions."
-
-                    elif "improve" in user_query.lower() and "budget" in user_query.lower():
-                        response = """Here are some ways to improve your budget:
-
-1. Track all expenses for at least 30 days to understand your spending patterns.
-2. Use the 50/30/20 rule: 50% for needs, 30% for wants, and 20% for savings.
-3. Identify and cut unnecessary subscriptions.
-4. Set specific financial goals to stay motivated.
-5. Review and adjust your budget monthly."""
-
-                    elif "track" in user_query.lower() and "goals" in user_query.lower():
-                        if st.session_state.goals:
-                            on_track_goals = []
-                            off_track_goals = []
-
-                            for goal in st.session_state.goals:
-                                # Calculate expected progress based on time
-                                target_date = datetime.strptime(goal["date"], "%Y-%m-%d")
-                                start_date = target_date - timedelta(days=365)  # Assume goal was set a year before target
-                                total_days = (target_date - start_date).days
-                                days_passed = (datetime.now() - start_date).days
-
-                                if total_days > 0 and days_passed > 0:
-                                    expected_progress = min(days_passed / total_days, 1) * 100
-                                    actual_progress = (goal["current"] / goal["target"]) * 100
-
-                                    if actual_progress >= expected_progress * 0.9:  # Within 90% of expected
-                                        on_track_goals.append(goal["name"])
-                                    else:
-                                        off_track_goals.append(goal["name"])
-
-                            if on_track_goals and off_track_goals:
-                                response = f"You're on track with these goals: {', '.join(on_track_goals)}. However, you're falling behind on: {', '.join(off_track_goals)}. Consider adjusting your monthly contributions."
-                            elif on_track_goals:
-                                response = f"Great news! You're on track with all your goals: {', '.join(on_track_goals)}. Keep up the good work!"
-                            else:
-                                response = f"You're currently behind on all your goals: {', '.join(off_track_goals)}. Let's review your budget to find ways to increase your contributions."
-                        else:
-                            response = "You don't have any financial goals set up yet. Let's set some goals to track your progress!"
-
-                    elif "biggest expense" in user_query.lower():
-                        if not st.session_state.transactions.empty:
-                            # Filter for expenses
-                            transactions_df = st.session_state.transactions.copy()
-                            expenses = transactions_df[transactions_df['type'] == 'expense']
-
-                            if not expenses.empty:
-                                # Group by category
-                                category_expenses = expenses.groupby('category')['amount'].sum().abs()
-                                biggest_category = category_expenses.idxmax()
-                                biggest_amount = category_expenses.max()
-
-                                response = f"Your biggest expense category is {biggest_category}, where you've spent €{biggest_amount:.2f}. This represents {(biggest_amount / category_expenses.sum()) * 100:.1f}% of your total expenses."
-                            else:
-                                response = "I don't have enough expense data to determine your biggest category. Please add more expense transactions."
-                        else:
-                            response = "I don't have any transaction data yet. Please add some expense transactions so I can analyze your spending patterns."
-
-                    st.write(response)
+                # Answered from the rollup indexes, no scan of the ledger
+                response = answer_assistant_query(user_query)
+                st.write(response)
 
                 # Add AI response to chat history
-                st.session_state.ai_messages.append({"role": "assistant", "content": response})
+                append_chat_message("assistant", response)
+
+        stats = answer_cache_stats()
+        if stats["hits"] + stats["misses"] > 0:
+            st.caption(f"Answer cache: {stats['hits']} of {stats['hits'] + stats['misses']} answers reused ({stats['hit_rate']:.0%} hit rate)")
     else:
         st.warning("The AI Financial Assistant is available with Pro and Elite subscriptions.")
         if st.button("Upgrade Subscription"):
@@ -1822,10 +3768,20 @@ def initialize_session_state():
      # Transactions
      if 'transactions' not in st.session_state:
          st.session_state.transactions = pd.DataFrame(columns=["date", "category", "amount", "description", "type"])
+     if 'ledger_version' not in st.session_state:
+         st.session_state.ledger_version = 0
 
      # Goals
      if 'goals' not in st.session_state:
-         st.session_state.goals = []
+         st.session_state.goals = {}
+     if 'goal_metrics' not in st.session_state:
+         st.session_state.goal_metrics = {'count': 0, 'progress_sum': 0.0}
+     if 'goals_version' not in st.session_state:
+         st.session_state.goals_version = 0
+
+     # Budget envelopes
+     if 'budget_limits' not in st.session_state:
+         st.session_state.budget_limits = {}
 
      # Insights
      if 'insights' not in st.session_state:
@@ -2006,14 +3962,19 @@ def display_login():
              login_button = st.form_submit_button("Login")
 
              if login_button:
-                 # For demo purposes, any non-empty username/password works
-                 if username and password:
+                 user_id = authenticate_user(username, password) if username and password else None
+                 if user_id:
                      st.session_state.login_status = True
                      st.session_state.current_page = 'dashboard'
                      initialize_session_state()
+
+                     # Restore goals saved by an earlier session
+                     start_user_session(user_id, username)
                      st.rerun()
-                 else:
+                 elif not username or not password:
                      st.error("Please enter username and password")
+                 else:
+                     st.error("Incorrect username or password")
 
      with col2:
          with st.form("register_form"):
@@ -2025,10 +3986,15 @@ def display_login():
 
              if register_button:
                  if new_username and new_password and new_password == confirm_password:
-                     st.session_state.login_status = True
-                     st.session_state.current_page = 'dashboard'
-                     initialize_session_state()
-                     st.rerun()
+                     user_id = register_user(new_username, new_password)
+                     if user_id:
+                         st.session_state.login_status = True
+                         st.session_state.current_page = 'dashboard'
+                         initialize_session_state()
+                         start_user_session(user_id, new_username)
+                         st.rerun()
+                     else:
+                         st.error("That username is already taken")
                  elif not new_username or not new_password:
                      st.error("Please fill in all fields")
                  else: